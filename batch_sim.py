@@ -0,0 +1,526 @@
+import sys
+import time
+
+import numpy as np
+
+import brick_breaker as bb
+
+# Power-up types in POWERUP_CHANCES order, referenced by index in the arrays
+POWERUP_TYPES = list(bb.POWERUP_CHANCES.keys())
+PU_EXTEND = POWERUP_TYPES.index('extend')
+PU_SHRINK = POWERUP_TYPES.index('shrink')
+PU_SPEED_UP = POWERUP_TYPES.index('speed_up')
+PU_EXTRA_LIFE = POWERUP_TYPES.index('extra_life')
+PU_MULTI_BALL = POWERUP_TYPES.index('multi_ball')
+
+PADDLE_SPEED = 8
+PADDLE_Y = bb.WINDOW_HEIGHT - 40
+BALL_RADIUS = bb.BALL_SIZE // 2
+
+
+def _round(values):
+    # pygame.Rect attribute setters round to the nearest pixel
+    return np.floor(values + 0.5)
+
+
+# Per-object arrays. Balls and power-ups are stored flat: one entry per
+# object that exists, tagged with its game and its slot in that game
+BALL_FIELDS = ('ball_game', 'ball_slot', 'ball_x', 'ball_y', 'ball_dx', 'ball_dy', 'ball_in_play')
+BALL_DTYPES = (np.intp, np.int8, np.float64, np.float64, np.float64, np.float64, bool)
+PU_FIELDS = ('pu_game', 'pu_slot', 'pu_x', 'pu_y', 'pu_type')
+PU_DTYPES = (np.intp, np.int8, np.int32, np.int32, np.int8)
+
+
+class BatchSimulator:
+    # Runs N independent games of one level in lock step. Per-game state
+    # (paddle, score, lives, brick hit counts) is a set of struct-of-arrays
+    # buffers, and one step() advances every game with the same rules as
+    # GameState.step. Balls and falling power-ups are kept as flat arrays of
+    # the objects that exist, each tagged with its game and a slot number
+    # below max_balls / max_power_ups that orders it within the game, so the
+    # work per frame follows the objects in play rather than N times the
+    # capacity. Objects of finished games are dropped. A multi_ball that
+    # finds no free slot is dropped instead of growing the game.
+    #
+    # A ball faster than MAX_BALL_STEP moves in substeps with collision checks
+    # after each, and a ball meets the bricks it touches in level order, both
+    # as in GameState. What differs: within a (sub)step the balls of a game
+    # are resolved together rather than one after another, so a brick hit by
+    # two balls at once loses two hits and both bounce, and power-up spawns
+    # draw from a numpy Generator rather than the game's random.Random, so
+    # games don't replay a scalar seed once a power-up roll comes up.
+    def __init__(self, n_games, level_name='Classic', max_balls=8,
+                 max_power_ups=8, seed=None):
+        self.n = n_games
+        self.level_name = level_name
+        self.max_balls = max_balls
+        self.max_power_ups = max_power_ups
+        self.rng = np.random.default_rng(seed)
+
+        # Brick layout is shared by every game; only the hit counts differ
+        field = bb.LEVELS[level_name]['pattern']()
+        indices = np.array(list(field), dtype=np.int64)
+        rows, cols = np.divmod(indices, field.cols)
+        self.brick_left = (field.x + cols * bb.BRICK_PITCH_X).astype(np.float64)
+        self.brick_top = (field.y + rows * bb.BRICK_PITCH_Y).astype(np.float64)
+        self.brick_right = self.brick_left + bb.BRICK_WIDTH
+        self.brick_bottom = self.brick_top + bb.BRICK_HEIGHT
+        # Broad phase table: for a ball rect's top-left pixel, the brick of
+        # the layout it overlaps, or -1 for none and -2 for several. Bricks
+        # only ever disappear, so a ball over -1 can't touch a standing one.
+        # Rows from the bottom of the field down share the last, empty row.
+        size = 2 * BALL_RADIUS
+        self.touch_width = bb.WINDOW_WIDTH
+        self.touch = np.full((int(self.brick_bottom.max()) + 1, self.touch_width), -1, dtype=np.int16)
+        for brick, (left, top) in enumerate(zip(self.brick_left.astype(int), self.brick_top.astype(int))):
+            area = self.touch[max(0, top - size + 1):top + bb.BRICK_HEIGHT,
+                              max(0, left - size + 1):left + bb.BRICK_WIDTH]
+            area[...] = np.where(area == -1, brick, -2)
+        self.touch_rows = len(self.touch) - 1
+        self.touch = self.touch.reshape(-1)
+        self.brick_cx = (self.brick_left + bb.BRICK_WIDTH // 2).astype(np.int32)
+        self.brick_cy = (self.brick_top + bb.BRICK_HEIGHT // 2).astype(np.int32)
+        types = np.frombuffer(field.types, dtype=np.uint8)[indices]
+        self.brick_points = np.array(bb.BRICK_TYPE_POINTS, dtype=np.int32)[types]
+        self.initial_hits = np.frombuffer(field.hits, dtype=np.uint8)[indices].astype(np.int8)
+        # Lattice cell -> brick number (or -1), for finding what a ball touches
+        self.grid_x, self.grid_y = field.x, field.y
+        self.grid_rows, self.grid_cols = field.rows, field.cols
+        self.cell_brick = np.full(field.rows * field.cols, -1, dtype=np.intp)
+        self.cell_brick[indices] = np.arange(len(indices))
+
+        self.spawn_chance = sum(bb.POWERUP_CHANCES.values())
+        weights = np.array(list(bb.POWERUP_CHANCES.values()), dtype=np.float64)
+        self.powerup_cdf = np.cumsum(weights / weights.sum())
+
+        self.reset()
+
+    def reset(self):
+        n, p = self.n, self.max_power_ups
+        self.hits = np.tile(self.initial_hits, (n, 1))
+        self.bricks_left = np.full(n, len(self.initial_hits), dtype=np.int32)
+
+        self.paddle_x = np.full(n, bb.WINDOW_WIDTH // 2 - bb.PADDLE_WIDTH // 2, dtype=np.float64)
+        self.paddle_width = np.full(n, bb.PADDLE_WIDTH, dtype=np.float64)
+        self.paddle_speed = np.full(n, PADDLE_SPEED, dtype=np.float64)
+        self.paddle_timer = np.zeros(n, dtype=np.int32)
+
+        for name, dtype in zip(BALL_FIELDS + PU_FIELDS, BALL_DTYPES + PU_DTYPES):
+            setattr(self, name, np.zeros(0, dtype=dtype))
+        self.ball_count = np.zeros(n, dtype=np.intp)
+        # Which power-up slots each game is using, for handing out free ones
+        self.pu_used = np.zeros((p, n), dtype=bool)
+
+        self.score = np.zeros(n, dtype=np.int64)
+        self.lives = np.full(n, bb.INITIAL_LIVES, dtype=np.int32)
+        self.game_over = np.zeros(n, dtype=bool)
+        self.won = np.zeros(n, dtype=bool)
+        self.frame = 0
+
+        self._reset_ball(np.arange(n))
+
+    @property
+    def finished(self):
+        return self.game_over | self.won
+
+    def _append(self, fields, values):
+        for name, value in zip(fields, values):
+            array = getattr(self, name)
+            setattr(self, name, np.concatenate((array, np.asarray(value, dtype=array.dtype))))
+
+    def _keep(self, fields, keep):
+        for name in fields:
+            setattr(self, name, getattr(self, name)[keep])
+
+    def _add_balls(self, games, slots, x, y, dx, dy, in_play):
+        self._append(BALL_FIELDS, (games, slots, x, y, dx, dy, in_play))
+        self.ball_count = np.bincount(self.ball_game, minlength=self.n)
+
+    def _keep_balls(self, keep):
+        self._keep(BALL_FIELDS, keep)
+        self.ball_count = np.bincount(self.ball_game, minlength=self.n)
+
+    def _keep_power_ups(self, keep):
+        gone = ~keep
+        self.pu_used[self.pu_slot[gone], self.pu_game[gone]] = False
+        self._keep(PU_FIELDS, keep)
+
+    def _drop_games(self, games):
+        # Finished games stop moving, so their objects are removed
+        mask = np.zeros(self.n, dtype=bool)
+        mask[games] = True
+        if len(self.ball_game):
+            self._keep_balls(~mask[self.ball_game])
+        if len(self.pu_game):
+            self._keep_power_ups(~mask[self.pu_game])
+
+    def _reset_ball(self, games):
+        # Equivalent of Ball(paddle) for games that have no balls left: one
+        # ball resting on the paddle in slot 0
+        if len(games) == 0:
+            return
+        self._add_balls(games, np.zeros(len(games)),
+                        self.paddle_x[games] + self.paddle_width[games] // 2,
+                        np.full(len(games), PADDLE_Y - BALL_RADIUS),
+                        self.rng.choice([-1, 1], size=len(games)) * bb.BALL_SPEED,
+                        np.full(len(games), -bb.BALL_SPEED),
+                        np.zeros(len(games), dtype=bool))
+
+    def step(self, inputs=0):
+        inputs = np.broadcast_to(np.asarray(inputs, dtype=np.uint8), (self.n,))
+        active = ~(self.game_over | self.won)
+        self.frame += 1
+        games = self.ball_game
+
+        # Launch waiting balls
+        waiting = np.flatnonzero(~self.ball_in_play)
+        if len(waiting):
+            launch = active & (inputs & bb.INPUT_LAUNCH).astype(bool)
+            playing = np.zeros(self.n, dtype=bool)
+            playing[games[self.ball_in_play]] = True
+            launch &= ~playing
+            self.ball_in_play[waiting] = launch[games[waiting]]
+            waiting = waiting[~self.ball_in_play[waiting]]
+
+        # Move paddle, clamped after each direction like Paddle.move
+        limit = bb.WINDOW_WIDTH - self.paddle_width
+        left = active & (inputs & bb.INPUT_LEFT).astype(bool)
+        right = active & (inputs & bb.INPUT_RIGHT).astype(bool)
+        x = self.paddle_x - self.paddle_speed * left
+        np.minimum(np.maximum(x, 0, out=x), limit, out=x)
+        x += self.paddle_speed * right
+        self.paddle_x = np.minimum(np.maximum(x, 0, out=x), limit, out=x)
+
+        # Paddle power-up timers
+        ticking = np.flatnonzero(active & (self.paddle_timer > 0))
+        if len(ticking):
+            self.paddle_timer[ticking] -= 1
+            expired = ticking[self.paddle_timer[ticking] == 0]
+            self.paddle_width[expired] = bb.PADDLE_WIDTH
+            self.paddle_speed[expired] = PADDLE_SPEED
+
+        # Balls waiting on the paddle follow it
+        moving = self.ball_in_play
+        if len(waiting):
+            owners = games[waiting]
+            target_x = self.paddle_x[owners] + self.paddle_width[owners] // 2
+            self.ball_x[waiting] += target_x - self.ball_x[waiting]
+            self.ball_y[waiting] += PADDLE_Y - BALL_RADIUS - self.ball_y[waiting]
+
+        # Balls faster than MAX_BALL_STEP advance in substeps, each with its
+        # own collision checks, as in GameState.step
+        # (a ball waiting on the paddle is never fast)
+        if max(np.abs(self.ball_dx).max(initial=0),
+               np.abs(self.ball_dy).max(initial=0)) <= bb.MAX_BALL_STEP:
+            self._move_balls(moving)
+        else:
+            speed = np.maximum(np.abs(self.ball_dx), np.abs(self.ball_dy))
+            substeps = np.where(moving, np.maximum(1, np.ceil(speed / bb.MAX_BALL_STEP)), 0)
+            fraction = 1.0 / np.maximum(substeps, 1)
+            for substep in range(int(substeps.max())):
+                self._move_balls(substeps > substep, fraction)
+
+        # Ball out of bounds; a game that loses its last ball loses a life
+        out = self.ball_y > bb.WINDOW_HEIGHT
+        dead = None
+        if out.any():
+            losing = np.unique(games[out])
+            self._keep_balls(~out)
+            lost = losing[self.ball_count[losing] == 0]
+            self.lives[lost] -= 1
+            dead = lost[self.lives[lost] <= 0]
+            self.game_over[dead] = True
+            active[dead] = False
+            self._reset_ball(lost[self.lives[lost] > 0])
+            if len(dead) and len(self.pu_game):
+                self._keep_power_ups(~self.game_over[self.pu_game])
+
+        self._update_power_ups()
+        won = np.flatnonzero(active & (self.bricks_left == 0))
+        if len(won):
+            self.won[won] = True
+            self._drop_games(won)
+
+    def _move_balls(self, moving, fraction=None):
+        # Ball.move with wall bounces, then the paddle and brick collisions,
+        # for the balls in `moving`, each by `fraction` of its velocity (by
+        # default all of it). A ball past a wall is put back inside and sent
+        # away from it.
+        x, y, dx, dy = self.ball_x, self.ball_y, self.ball_dx, self.ball_dy
+        if fraction is not None:
+            dx, dy = dx * fraction, dy * fraction
+        x += dx * moving
+        y += dy * moving
+        dx, dy = self.ball_dx, self.ball_dy
+        side = np.flatnonzero(((x <= BALL_RADIUS) | (x >= bb.WINDOW_WIDTH - BALL_RADIUS)) & moving)
+        if len(side):
+            wall_left = x[side] <= BALL_RADIUS
+            x[side] = np.where(wall_left, BALL_RADIUS, bb.WINDOW_WIDTH - BALL_RADIUS)
+            dx[side] = np.where(wall_left, np.abs(dx[side]), -np.abs(dx[side]))
+        top = np.flatnonzero((y <= BALL_RADIUS) & moving)
+        if len(top):
+            y[top] = BALL_RADIUS
+            dy[top] = np.abs(dy[top])
+
+        self._collide_paddle(moving)
+        self._collide_bricks(moving)
+
+    def _ball_rects(self, balls):
+        left = _round(self.ball_x[balls] - BALL_RADIUS)
+        top = _round(self.ball_y[balls] - BALL_RADIUS)
+        return left, top, left + 2 * BALL_RADIUS, top + 2 * BALL_RADIUS
+
+    def _collide_paddle(self, moving):
+        # Only balls level with the paddle can touch it
+        balls = np.flatnonzero(moving & (self.ball_y > PADDLE_Y - 2 * BALL_RADIUS))
+        if len(balls) == 0:
+            return
+        games = self.ball_game[balls]
+        left, top, right, bottom = self._ball_rects(balls)
+        paddle_left = _round(self.paddle_x[games])
+        paddle_right = paddle_left + _round(self.paddle_width[games])
+        hit = ((left < paddle_right) & (right > paddle_left)
+               & (top < PADDLE_Y + bb.PADDLE_HEIGHT) & (bottom > PADDLE_Y))
+        balls, games = balls[hit], games[hit]
+
+        # Paddle bounce: angle depends on where the ball meets the paddle
+        half = self.paddle_width[games] / 2
+        normalized = ((self.paddle_x[games] + half) - self.ball_x[balls]) / half
+        # Degrees to radians the way Vector2.from_polar does it, to the bit
+        self.ball_dx[balls] = -bb.BALL_SPEED * np.cos(normalized * 60 * np.pi / 180)
+        self.ball_dy[balls] = -np.abs(self.ball_dy[balls])
+
+    def _collide_bricks(self, moving):
+        # Broad phase: one table lookup per ball. Walls keep balls at x, y >=
+        # BALL_RADIUS, so rect corners are never negative.
+        left = _round(self.ball_x - BALL_RADIUS)
+        top = _round(self.ball_y - BALL_RADIUS)
+        near = self.touch[np.minimum(top, self.touch_rows).astype(np.intp) * self.touch_width
+                          + left.astype(np.intp)]
+        balls = np.flatnonzero((near != -1) & moving)
+        if len(balls) == 0:
+            return
+        near, left, top = near[balls], left[balls], top[balls]
+        right, bottom = left + 2 * BALL_RADIUS, top + 2 * BALL_RADIUS
+
+        # Narrow phase, as flat (ball, brick) pairs with the position of the
+        # brick among those the ball touches. Most balls touch a single brick
+        # of the layout and the table names it.
+        hit = np.flatnonzero(near >= 0)
+        bricks = near[hit].astype(np.intp)
+        corners = np.zeros(len(hit), dtype=np.intp)
+        several = np.flatnonzero(near == -2)
+        if len(several):
+            # A ball is smaller than a lattice cell, so it can only touch the
+            # bricks in the (up to) 2x2 cells under its corners. Each array
+            # here is (4 corners, balls).
+            cols = (np.stack((left[several], right[several] - 1)) - self.grid_x) // bb.BRICK_PITCH_X
+            rows = (np.stack((top[several], bottom[several] - 1)) - self.grid_y) // bb.BRICK_PITCH_Y
+            rows, cols = rows[[0, 0, 1, 1]], cols[[0, 1, 0, 1]]
+            valid = (rows >= 0) & (rows < self.grid_rows) & (cols >= 0) & (cols < self.grid_cols)
+            # A corner in the same cell as an earlier one is not counted twice
+            valid[1::2] &= cols[1] != cols[0]
+            valid[2:] &= rows[2] != rows[0]
+            cell = np.where(valid, rows * self.grid_cols + cols, 0).astype(np.intp)
+            brick = self.cell_brick[cell]
+            valid &= brick >= 0
+            corner, ball = np.nonzero(valid)
+            brick = brick[corner, ball]
+            ball = several[ball]
+            overlap = ((left[ball] < self.brick_right[brick]) & (right[ball] > self.brick_left[brick])
+                       & (top[ball] < self.brick_bottom[brick]) & (bottom[ball] > self.brick_top[brick]))
+            hit = np.concatenate((hit, ball[overlap]))
+            bricks = np.concatenate((bricks, brick[overlap]))
+            corners = np.concatenate((corners, corner[overlap]))
+        games = self.ball_game[balls]
+        standing = self.hits[games[hit], bricks] > 0
+        if not standing.all():
+            hit, bricks, corners = hit[standing], bricks[standing], corners[standing]
+        if len(hit) == 0:
+            return
+        left, top, right, bottom = left[hit], top[hit], right[hit], bottom[hit]
+        brick_left, brick_right = self.brick_left[bricks], self.brick_right[bricks]
+        brick_top, brick_bottom = self.brick_top[bricks], self.brick_bottom[bricks]
+
+        # Side detection from check_collision. The corners run row-major, so
+        # a ball meets its bricks in level order, as in BrickField.query, and
+        # each sees the velocity the bricks before it left
+        for corner in np.unique(corners):
+            at = corners == corner
+            ball = balls[hit[at]]
+            dx, dy = self.ball_dx[ball], self.ball_dy[ball]
+            from_above = (np.abs(bottom[at] - brick_top[at]) < 10) & (dy > 0)
+            from_below = ~from_above & (np.abs(top[at] - brick_bottom[at]) < 10) & (dy < 0)
+            vertical = from_above | from_below
+            from_left = ~vertical & (np.abs(right[at] - brick_left[at]) < 10) & (dx > 0)
+            from_right = ~vertical & ~from_left & (np.abs(left[at] - brick_right[at]) < 10) & (dx < 0)
+            self.ball_dy[ball] = np.where(vertical, -dy, dy)
+            self.ball_dx[ball] = np.where(from_left | from_right, -dx, dx)
+
+        # Every (game, brick) touched loses one hit per ball touching it
+        count = len(self.initial_hits)
+        touched, taken = np.unique(games[hit] * count + bricks, return_counts=True)
+        hits = self.hits.reshape(-1)
+        after = np.maximum(hits[touched] - taken, 0).astype(np.int8)
+        hits[touched] = after
+        destroyed = touched[after == 0]
+        games, bricks = np.divmod(destroyed, count)
+        np.add.at(self.score, games, self.brick_points[bricks])
+        np.subtract.at(self.bricks_left, games, 1)
+
+        spawn = self.rng.random(len(games)) < self.spawn_chance
+        games, bricks = games[spawn], bricks[spawn]
+        types = np.searchsorted(self.powerup_cdf, self.rng.random(len(games)), side='right')
+        types = np.minimum(types, len(POWERUP_TYPES) - 1)
+        # Several spawns in one game this frame each take the next free slot
+        while len(games):
+            first = np.unique(games, return_index=True)[1]
+            g = games[first]
+            free = ~self.pu_used[:, g]
+            has_slot = free.any(axis=0)
+            slot = free.argmax(axis=0)
+            g, slot = g[has_slot], slot[has_slot]
+            b, kind = bricks[first][has_slot], types[first][has_slot]
+            self.pu_used[slot, g] = True
+            self._append(PU_FIELDS, (g, slot, self.brick_cx[b], self.brick_cy[b], kind))
+            rest = np.ones(len(games), dtype=bool)
+            rest[first] = False
+            games, bricks, types = games[rest], bricks[rest], types[rest]
+
+    def _update_power_ups(self):
+        if len(self.pu_game) == 0:
+            return
+        self.pu_y += bb.POWERUP_SPEED
+        games, x, y = self.pu_game, self.pu_x, self.pu_y
+        paddle_left = _round(self.paddle_x[games])
+        paddle_right = paddle_left + _round(self.paddle_width[games])
+        caught = ((x < paddle_right) & (x + bb.POWERUP_SIZE > paddle_left)
+                  & (y < PADDLE_Y + bb.PADDLE_HEIGHT) & (y + bb.POWERUP_SIZE > PADDLE_Y))
+        gone = caught | (y > bb.WINDOW_HEIGHT)
+        if not gone.any():
+            return
+        caught = np.flatnonzero(caught)
+        games, slots, kinds = games[caught], self.pu_slot[caught], self.pu_type[caught]
+        self._keep_power_ups(~gone)
+        if len(caught) == 0:
+            return
+        # Several catches in one game stack in slot order, like iterating the
+        # power_ups list: every game's first catch is applied, then every
+        # game's second, and so on
+        order = np.lexsort((games, slots))
+        games, slots, kinds = games[order], slots[order], kinds[order]
+        for slot in np.unique(slots):
+            same = slots == slot
+            self._apply_power_ups(games[same], kinds[same])
+
+    def _apply_power_ups(self, games, kind):
+        extend = games[kind == PU_EXTEND]
+        shrink = games[kind == PU_SHRINK]
+        speed_up = games[kind == PU_SPEED_UP]
+        self.paddle_width[extend] = np.minimum(200, self.paddle_width[extend] * 1.5)
+        self.paddle_width[shrink] = np.maximum(50, self.paddle_width[shrink] * 0.75)
+        self.paddle_speed[speed_up] = np.minimum(16, self.paddle_speed[speed_up] * 1.5)
+        self.paddle_timer[np.concatenate([extend, shrink, speed_up])] = 600
+        self.lives[games[kind == PU_EXTRA_LIFE]] += 1
+
+        # multi_ball clones the first two balls in play (or the first one
+        # twice) into the first free slots. Each game catches at most one per
+        # call; rows below are those games, in order.
+        catching = games[kind == PU_MULTI_BALL]
+        if len(catching) == 0:
+            return
+        row_of = np.full(self.n, -1)
+        row_of[catching] = np.arange(len(catching))
+        balls = np.flatnonzero(row_of[self.ball_game] >= 0)
+        rows = row_of[self.ball_game[balls]]
+        order = np.lexsort((self.ball_slot[balls], rows))
+        balls, rows = balls[order], rows[order]
+        used = np.zeros((len(catching), self.max_balls), dtype=bool)
+        used[rows, self.ball_slot[balls]] = True
+        in_play = self.ball_in_play[balls]
+        balls, rows = balls[in_play], rows[in_play]
+        rank = np.arange(len(rows)) - np.searchsorted(rows, rows)
+        first_two = rank < 2
+        sources = np.zeros((len(catching), 2), dtype=np.intp)
+        sources[rows[first_two], rank[first_two]] = balls[first_two]
+        found = np.bincount(rows[first_two], minlength=len(catching))
+        sources[found == 1, 1] = sources[found == 1, 0]
+        free = np.argsort(used, axis=1, kind='stable')[:, :2]
+        count = np.where(found > 0, np.minimum(2, (~used).sum(axis=1)), 0)
+        cloned = np.arange(2) < count[:, None]
+        if not cloned.any():
+            return
+        src = sources[cloned]
+        # One draw for all clones gives the same stream as a draw per clone
+        speed = self.rng.choice([0.8, 1, 1.2], size=(len(src), 2))
+        self._add_balls(np.broadcast_to(catching[:, None], cloned.shape)[cloned], free[cloned],
+                        self.ball_x[src], self.ball_y[src],
+                        self.ball_dx[src] * speed[:, 0], self.ball_dy[src] * speed[:, 1],
+                        np.ones(len(src), dtype=bool))
+
+    def tracking_inputs(self):
+        # Simple controller for headless runs: launch and follow the lowest
+        # ball (the lowest slot among balls level with each other)
+        target = np.zeros(self.n)
+        games, y = self.ball_game, self.ball_y
+        target[games] = self.ball_x
+        # Games with several balls are settled separately
+        several = np.flatnonzero(self.ball_count[games] > 1)
+        if len(several):
+            games, y, slots = games[several], y[several], self.ball_slot[several]
+            lowest = np.full(self.n, -np.inf)
+            np.maximum.at(lowest, games, y)
+            level = np.flatnonzero(y == lowest[games])
+            first = np.full(self.n, self.max_balls, dtype=np.int8)
+            np.minimum.at(first, games[level], slots[level])
+            level = level[slots[level] == first[games[level]]]
+            target[games[level]] = self.ball_x[several[level]]
+        center = self.paddle_x + self.paddle_width / 2
+        inputs = np.full(self.n, bb.INPUT_LAUNCH, dtype=np.uint8)
+        inputs |= (target < center - 10) * np.uint8(bb.INPUT_LEFT)
+        inputs |= (target > center + 10) * np.uint8(bb.INPUT_RIGHT)
+        return inputs
+
+
+def scalar_tracking_inputs(state):
+    ball = max(state.balls, key=lambda b: b.y)
+    center = state.paddle.x + state.paddle.width / 2
+    inputs = bb.INPUT_LAUNCH
+    if ball.x < center - 10:
+        inputs |= bb.INPUT_LEFT
+    elif ball.x > center + 10:
+        inputs |= bb.INPUT_RIGHT
+    return inputs
+
+
+def measure(n_games=32768, frames=600, level_name='Classic', max_balls=8, scalar_games=8, rounds=6):
+    # Returns (scalar game-frames/sec, batched game-frames/sec). The scalar
+    # side plays several seeded games, since one game's rate swings with what
+    # it happens to have in play. Both sides run in alternating rounds on the
+    # process clock, so a machine that speeds up or slows down meanwhile
+    # skews them alike
+    states = [bb.GameState(level_name, seed=seed) for seed in range(scalar_games)]
+    sim = BatchSimulator(n_games, level_name, max_balls=max_balls, seed=0)
+    scalar_time = batch_time = 0.0
+    chunk = frames // rounds
+    for _ in range(rounds):
+        start = time.process_time()
+        for i, state in enumerate(states):
+            for _ in range(chunk):
+                if state.finished:
+                    state = states[i] = bb.GameState(level_name, seed=i + scalar_games)
+                state.step(scalar_tracking_inputs(state))
+        scalar_time += time.process_time() - start
+        start = time.process_time()
+        for _ in range(chunk):
+            sim.step(sim.tracking_inputs())
+        batch_time += time.process_time() - start
+    return (scalar_games * chunk * rounds / scalar_time,
+            n_games * chunk * rounds / batch_time)
+
+if __name__ == "__main__":
+    n_games = int(sys.argv[1]) if len(sys.argv) > 1 else 32768
+    for level_name in bb.LEVELS:
+        scalar_rate, batch_rate = measure(n_games, level_name=level_name)
+        print(f"{level_name:10s} scalar {scalar_rate:12.0f} frames/s  "
+              f"batch {batch_rate:12.0f} frames/s  ({batch_rate / scalar_rate:.1f}x)")
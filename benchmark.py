@@ -0,0 +1,440 @@
+import argparse
+import gc
+import json
+import math
+import os
+import random
+import sys
+import time
+import tracemalloc
+from array import array
+from contextlib import contextmanager
+from functools import partial
+
+import brick_breaker as bb
+
+BALL_COUNTS = (1, 10, 100, 1000)
+SCALES = (1, 10, 100)
+# Regressions larger than this fraction fail a --compare run
+DEFAULT_TOLERANCE = 0.10
+
+
+@contextmanager
+def world_size(width, height):
+    # The game reads the window size from module constants at call time, so
+    # a scaled level temporarily widens the playfield
+    saved = bb.WINDOW_WIDTH, bb.WINDOW_HEIGHT
+    bb.WINDOW_WIDTH, bb.WINDOW_HEIGHT = width, height
+    try:
+        yield
+    finally:
+        bb.WINDOW_WIDTH, bb.WINDOW_HEIGHT = saved
+
+
+def scaled_bricks(level_name, scale):
+    # Tile the level's brick grid `scale` times into one larger field and
+    # size the playfield around it, keeping the usual space below the bricks
+    base = bb.LEVELS[level_name]['pattern']()
+    tiles_x = math.ceil(math.sqrt(scale))
+    tiles_y = math.ceil(scale / tiles_x)
+    field = bb.BrickField(base.rows * tiles_y, base.cols * tiles_x, x=base.x, y=base.y)
+    for tile in range(scale):
+        first_row = (tile // tiles_x) * base.rows
+        first_col = (tile % tiles_x) * base.cols
+        for index in base:
+            row, col = divmod(index, base.cols)
+            field.place(first_row + row, first_col + col, bb.BRICK_TYPE_NAMES[base.types[index]])
+    width = max(bb.WINDOW_WIDTH, 2 * field.x + field.cols * bb.BRICK_PITCH_X)
+    height = bb.WINDOW_HEIGHT + (field.rows - base.rows) * bb.BRICK_PITCH_Y
+    return field, (width, height)
+
+
+def spawn_ball(state, rng):
+    # A ball already in flight somewhere below the bricks, at normal speed
+    ball = state.new_ball()
+    ball.x = rng.uniform(ball.radius + 1, bb.WINDOW_WIDTH - ball.radius - 1)
+    ball.y = rng.uniform(bb.WINDOW_HEIGHT * 0.5, bb.WINDOW_HEIGHT - 60)
+    angle = rng.uniform(-math.pi * 0.4, math.pi * 0.4)
+    ball.dx = bb.BALL_SPEED * math.sin(angle)
+    ball.dy = -bb.BALL_SPEED * math.cos(angle)
+    ball.rect.center = (ball.x, ball.y)
+    ball.prev_x, ball.prev_y = ball.x, ball.y
+    ball.in_play = True
+    return ball
+
+
+def scripted_inputs(state):
+    # Launch, then chase the lowest ball that is coming down
+    paddle = state.paddle
+    falling = [ball for ball in state.balls if ball.dy > 0] or state.balls
+    target = max(falling, key=lambda ball: ball.y).x
+    center = paddle.x + paddle.width / 2
+    inputs = bb.INPUT_LAUNCH
+    if target < center - paddle.speed:
+        inputs |= bb.INPUT_LEFT
+    elif target > center + paddle.speed:
+        inputs |= bb.INPUT_RIGHT
+    return inputs
+
+
+# Paddle controllers by name; each entry makes a fresh controller for a run
+CONTROLLERS = {
+    'scripted': lambda: scripted_inputs,
+    'autopilot': bb.Autopilot,
+}
+
+
+def new_state(level_name, bricks, seed):
+    state = bb.GameState(level_name, seed=seed, bricks=bricks.copy())
+    state.lives = 10 ** 9  # runs last a fixed number of frames, not lives
+    return state
+
+
+def simulate(level_name, scale, balls, frames, seed, controller=scripted_inputs):
+    # Runs one configuration and returns (collision tests, seconds spent in
+    # GameState.step, garbage collections during the run, seconds spent in
+    # the controller). Lost balls are topped up and cleared levels restart,
+    # so every frame carries the requested load; that bookkeeping and level
+    # construction are left out of the timing.
+    bricks, size = scaled_bricks(level_name, scale)
+    rng = random.Random(seed)
+    clock = time.perf_counter
+    with world_size(*size):
+        state = new_state(level_name, bricks, seed)
+        tests = 0
+        elapsed = 0.0
+        thinking = 0.0
+        collections = sum(stats['collections'] for stats in gc.get_stats())
+        for _ in range(frames):
+            while len(state.balls) < balls:
+                state.balls.append(spawn_ball(state, rng))
+            start = clock()
+            inputs = controller(state)
+            thinking += clock() - start
+            start = clock()
+            state.step(inputs)
+            elapsed += clock() - start
+            if state.finished:
+                tests += state.collision_tests
+                state = new_state(level_name, bricks, seed)
+        collections = sum(stats['collections'] for stats in gc.get_stats()) - collections
+        return tests + state.collision_tests, elapsed, collections, thinking
+
+
+def run_case(level_name, scale, balls, frames, seed, measure_memory=True, controller='scripted'):
+    tests, elapsed, collections, thinking = simulate(level_name, scale, balls, frames, seed,
+                                                     CONTROLLERS[controller]())
+    result = {
+        'level': level_name,
+        'scale': scale,
+        'balls': balls,
+        'frames': frames,
+        'fps': frames / elapsed,
+        'collision_tests_per_frame': tests / frames,
+        'gc_collections': collections,
+        'controller': controller,
+        'controller_ms_per_frame': thinking * 1000 / frames,
+    }
+    if measure_memory:
+        # A second, traced pass: tracemalloc slows the run, so it is not timed
+        tracemalloc.start()
+        simulate(level_name, scale, balls, frames, seed, CONTROLLERS[controller]())
+        result['peak_memory_kb'] = tracemalloc.get_traced_memory()[1] / 1024
+        tracemalloc.stop()
+    return result
+
+
+def run_replay_case(path, measure_memory=True):
+    # Real player sessions replayed headless through the same measurements
+    replay = bb.Replay.load(path)
+    start = time.perf_counter()
+    state = bb.run_replay(replay)
+    elapsed = time.perf_counter() - start
+    result = {
+        'replay': os.path.basename(path),
+        'level': replay.level_name,
+        'frames': state.frame,
+        'fps': state.frame / elapsed,
+        'collision_tests_per_frame': state.collision_tests / max(1, state.frame),
+    }
+    if measure_memory:
+        tracemalloc.start()
+        bb.run_replay(replay)
+        result['peak_memory_kb'] = tracemalloc.get_traced_memory()[1] / 1024
+        tracemalloc.stop()
+    return result
+
+
+# Largest walls-only prediction error a --check-predictor run accepts. The
+# game turns a ball round only after it has crossed a wall, so each side
+# bounce can shift the real path by up to two steps.
+PREDICTOR_TOLERANCE_PX = 40
+
+
+def landing_error(state, ball, predictor, max_frames=5000):
+    # Moves `ball` the way GameState.step does, without the paddle, and
+    # returns how far from the predicted x it crosses the paddle line, or
+    # None if either never gets there
+    landing = predictor.predict(state, ball)
+    floor = state.paddle.y - ball.radius
+    for _ in range(max_frames):
+        substeps = ball.substeps()
+        for _ in range(substeps):
+            x, y = ball.x, ball.y
+            ball.move(1.0 / substeps)
+            if ball.dy > 0 and ball.y >= floor:
+                x += (ball.x - x) * (floor - y) / (ball.y - y)
+                return abs(landing[0] - x) if landing is not None else None
+            state.collide_ball(ball)
+    return None
+
+
+def check_predictor(cases, seed, level_names=()):
+    # Predicted against simulated landing x for balls fired in random
+    # directions, half of them to the left. The walls-only cases (an empty
+    # field) must land within PREDICTOR_TOLERANCE_PX; level cases include
+    # side hits on bricks, which the predictor does not model, and are only
+    # reported. Returns True if the walls-only check failed.
+    rng = random.Random(seed)
+    predictor = bb.TrajectoryPredictor()
+    failed = False
+    for level_name in (None,) + tuple(level_names):
+        errors = {'left': [], 'right': []}
+        for case in range(cases):
+            bricks = bb.LEVELS[level_name]['pattern']() if level_name else bb.BrickField(1, 1)
+            state = bb.GameState(level_name or 'Classic', seed=seed + case, bricks=bricks)
+            ball = spawn_ball(state, rng)
+            leftward = case % 2 == 1
+            if (ball.dx < 0) != leftward:
+                ball.dx = -ball.dx
+            state.balls[:] = [ball]
+            error = landing_error(state, ball, predictor)
+            if error is not None:
+                errors['left' if leftward else 'right'].append(error)
+        for direction, values in errors.items():
+            values.sort()
+            if not values:
+                continue
+            worst = values[-1]
+            bad = level_name is None and worst > PREDICTOR_TOLERANCE_PX
+            failed |= bad
+            print(f"{level_name or 'walls only':12s} {direction:5s} {len(values):5d} cases "
+                  f"median {values[len(values) // 2]:6.1f} px  p90 {values[len(values) * 9 // 10]:6.1f} px  "
+                  f"max {worst:6.1f} px{'  FAILED' if bad else ''}")
+    return failed
+
+
+# Soak runs sample every simulated minute. The endless row generator ramps
+# up density and toughness over its first ~120 rows (about 7 minutes), so
+# comparisons start after a warm-up.
+SOAK_WINDOW = 60 * bb.SIM_HZ
+SOAK_WARMUP_MINUTES = 10
+# Time per unit of work still moves a little with the game (how full the
+# field is, how often bricks break), so a soak allows more drift than a
+# benchmark case before failing
+SOAK_TOLERANCE = 0.25
+
+
+def run_soak(hours, seed, controller='autopilot', render=False):
+    # Plays endless mode for `hours` of simulated time and returns one sample
+    # per simulated minute: time per frame and per unit of work, allocated
+    # memory blocks, balls in play, and games played, points scored and rows
+    # generated so far. Games use the usual lives; when one ends the next
+    # starts on the following seed, as a player restarting would, so the
+    # session keeps breaking bricks and streaming rows for the whole run.
+    control = CONTROLLERS[controller]()
+    state = bb.GameState(bb.ENDLESS_LEVEL, seed=seed)
+    renderer = None
+    if render:
+        renderer = bb.OffscreenRenderer()
+        renderer.reset(state)
+    # CPU time of this process, so other load on the machine over a long run
+    # does not show up as a slowdown
+    clock = time.process_time
+    # Samples go into preallocated arrays so that keeping them does not show
+    # up as growth in the memory figures they record
+    minutes = int(hours * 60)
+    keys = ('ms_per_frame', 'us_per_unit', 'allocated_blocks', 'balls', 'games', 'points', 'rows')
+    columns = {key: array('d', bytes(8 * minutes)) for key in keys}
+    games = 1
+    points = rows = 0
+    elapsed = 0.0
+    tests = 0
+    for frame in range(1, minutes * SOAK_WINDOW + 1):
+        inputs = control(state)
+        start = clock()
+        state.step(inputs)
+        if renderer is not None:
+            renderer.draw(state)
+        elapsed += clock() - start
+        if state.finished:
+            points += state.score
+            rows += state.bricks.rows_generated
+            tests += state.collision_tests
+            state = bb.GameState(bb.ENDLESS_LEVEL, seed=seed + games)
+            games += 1
+            if renderer is not None:
+                renderer.reset(state)
+        if frame % SOAK_WINDOW == 0:
+            minute = frame // SOAK_WINDOW - 1
+            columns['ms_per_frame'][minute] = elapsed * 1000 / SOAK_WINDOW
+            # The cost of a frame grows with the balls in play and the bricks
+            # around them. A frame's fixed cost is about that of one collision
+            # test, so time per (frame + collision test) should stay flat
+            tests += state.collision_tests
+            columns['us_per_unit'][minute] = elapsed * 1e6 / (SOAK_WINDOW + tests)
+            columns['allocated_blocks'][minute] = sys.getallocatedblocks()
+            columns['balls'][minute] = len(state.balls)
+            columns['games'][minute] = games
+            columns['points'][minute] = points + state.score
+            columns['rows'][minute] = rows + state.bricks.rows_generated
+            elapsed = 0.0
+            tests = -state.collision_tests
+    timings = ('ms_per_frame', 'us_per_unit')
+    return [dict({key: columns[key][minute] if key in timings else int(columns[key][minute])
+                  for key in keys}, minute=minute + 1)
+            for minute in range(minutes)]
+
+
+def soak_report(samples, tolerance):
+    # Compares the medians of the first tenth of the run after the warm-up
+    # and of the last tenth (at least 5 minutes each); returns True if time
+    # per unit of work or memory grew past tolerance, or if the last stretch
+    # broke no bricks (balls that stop reaching the field make every frame
+    # cheap and would hide a slowdown in row streaming)
+    steady = samples[SOAK_WARMUP_MINUTES:] or samples
+    count = min(max(5, len(steady) // 10), len(steady) // 2) or 1
+    first = steady[:count]
+    last = steady[-count:]
+
+    def median(rows, key):
+        values = sorted(row[key] for row in rows)
+        return values[len(values) // 2]
+
+    failed = False
+    for key in ('us_per_unit', 'allocated_blocks', 'ms_per_frame', 'balls'):
+        before, after = median(first, key), median(last, key)
+        change = after / before - 1 if before else 0.0
+        flag = ''
+        if key in ('us_per_unit', 'allocated_blocks') and change > tolerance:
+            flag = '  REGRESSION'
+            failed = True
+        print(f"{key:18s} {before:12.3f} -> {after:12.3f} ({change:+7.1%}){flag}")
+    start = samples[-count - 1]['points'] if count < len(samples) else 0
+    if samples[-1]['points'] <= start:
+        print(f"no bricks broken in the last {count} simulated minutes")
+        failed = True
+    end = samples[-1]
+    print(f"{end['minute']} simulated minutes, {end['games']} games, {end['points']} points, "
+          f"{end['rows']} rows generated")
+    return failed
+
+
+def case_key(result):
+    if 'replay' in result:
+        return f"replay {result['replay']}"
+    key = f"{result['level']} x{result['scale']} balls={result['balls']}"
+    # Controllers play different games, so they are compared separately
+    if result.get('controller', 'scripted') != 'scripted':
+        key += f" {result['controller']}"
+    return key
+
+
+def compare(results, baseline, tolerance):
+    # Returns the keys that got slower (or did more collision work) than the
+    # baseline by more than `tolerance`
+    previous = {case_key(r): r for r in baseline['results']}
+    regressions = []
+    for result in results:
+        key = case_key(result)
+        old = previous.get(key)
+        if old is None:
+            continue
+        fps_change = result['fps'] / old['fps'] - 1
+        work_change = (result['collision_tests_per_frame']
+                       / max(old['collision_tests_per_frame'], 1e-9) - 1)
+        flag = ''
+        if fps_change < -tolerance or work_change > tolerance:
+            flag = '  REGRESSION'
+            regressions.append(key)
+        print(f"{key:32s} fps {fps_change:+7.1%}  tests/frame {work_change:+7.1%}{flag}")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Headless Brick Breaker benchmark")
+    parser.add_argument('--frames', type=int, default=600)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--levels', nargs='+', default=list(bb.LEVELS), choices=list(bb.LEVELS))
+    parser.add_argument('--scales', nargs='+', type=int, default=list(SCALES))
+    parser.add_argument('--balls', nargs='+', type=int, default=list(BALL_COUNTS))
+    parser.add_argument('--controller', choices=sorted(CONTROLLERS),
+                        help="paddle controller for the generated cases (default: scripted) "
+                             "or the soak (default: autopilot)")
+    parser.add_argument('--replays', nargs='+', default=[], metavar='PATH',
+                        help="also time headless playback of recorded replays")
+    parser.add_argument('--no-memory', action='store_true',
+                        help="skip the tracemalloc pass used for peak memory")
+    parser.add_argument('--save', metavar='PATH', help="write results as a baseline JSON file")
+    parser.add_argument('--compare', metavar='PATH', help="compare against a saved baseline")
+    parser.add_argument('--tolerance', type=float,
+                        help=f"allowed regression (default: {DEFAULT_TOLERANCE}, "
+                             f"{SOAK_TOLERANCE} for --soak)")
+    parser.add_argument('--soak', type=float, metavar='HOURS',
+                        help="instead of the cases, play endless mode for this many "
+                             "simulated hours and check time per frame and collision test and memory stay flat")
+    parser.add_argument('--check-predictor', type=int, metavar='CASES',
+                        help="check the autopilot's landing predictions against the simulation "
+                             "(walls only, then each of --levels); exit 1 on a walls-only miss")
+    parser.add_argument('--soak-render', action='store_true',
+                        help="with --soak: also draw every frame with the dirty-rect renderer")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.check_predictor:
+        return 1 if check_predictor(args.check_predictor, args.seed, args.levels) else 0
+    if args.soak:
+        samples = run_soak(args.soak, args.seed, args.controller or 'autopilot', args.soak_render)
+        if args.save:
+            with open(args.save, 'w') as f:
+                json.dump({'soak_hours': args.soak, 'seed': args.seed, 'samples': samples}, f, indent=2)
+        tolerance = SOAK_TOLERANCE if args.tolerance is None else args.tolerance
+        return 1 if soak_report(samples, tolerance) else 0
+    controller = args.controller or 'scripted'
+    cases = [(partial(run_case, controller=controller),
+              (level_name, scale, balls, args.frames, args.seed))
+             for level_name in args.levels
+             for scale in args.scales
+             for balls in args.balls]
+    cases += [(run_replay_case, (path,)) for path in args.replays]
+
+    results = []
+    for run, case_args in cases:
+        result = run(*case_args, measure_memory=not args.no_memory)
+        results.append(result)
+        memory = result.get('peak_memory_kb')
+        memory = f"{memory:10.0f} KB" if memory is not None else ''
+        collections = result.get('gc_collections')
+        collections = f"{collections:6d} gc" if collections is not None else ''
+        thinking = result.get('controller_ms_per_frame')
+        thinking = f"{thinking:8.3f} ms/frame control" if thinking is not None else ''
+        print(f"{case_key(result):32s} {result['fps']:10.0f} frames/s "
+              f"{result['collision_tests_per_frame']:10.1f} tests/frame {memory} {collections} {thinking}")
+        sys.stdout.flush()
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'frames': args.frames, 'seed': args.seed, 'results': results}, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        tolerance = DEFAULT_TOLERANCE if args.tolerance is None else args.tolerance
+        if compare(results, baseline, tolerance):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,26 @@
+import time
+
+# Start of the import, the zero point of App.report()
+IMPORT_STARTED = time.perf_counter()
+
+import argparse
+import csv
+import itertools
+import json
+import math
+import os
+import numpy as np
+# pygame prints a banner on import; keep workers and tools quiet
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
 import pygame
 import sys
 import random
+import sqlite3
+import struct
+from collections import OrderedDict, deque
 
-# Initialize Pygame
-pygame.init()
+import levelpack
+import scores
 
 # Constants
 WINDOW_WIDTH = 800
@@ -21,6 +38,14 @@ POWERUP_SPEED = 3
 POWERUP_SIZE = 20
 POWERUP_CHANCE = 0.2  # 20% chance for power-up to spawn
 
+# Fixed simulation timestep, independent of the display refresh rate
+SIM_HZ = 60
+SIM_DT = 1.0 / SIM_HZ
+MAX_FRAME_TIME = 0.25  # longer frames are clamped so a stall can't snowball
+# Balls moving further than this per step are substepped, so a fast ball
+# can't skip over a brick or sink too deep for check_collision to find the side
+MAX_BALL_STEP = BRICK_HEIGHT / 3
+
 # Power-up chances (percentages)
 POWERUP_CHANCES = {
     'extend': 0.15,    # 15% chance
@@ -41,6 +66,27 @@ PURPLE = (255, 0, 255)
 ORANGE = (255, 128, 0)
 BRICK_COLORS = [(255, 0, 0), (255, 128, 0), (255, 255, 0), (0, 255, 0), (0, 0, 255)]
 
+POWERUP_COLORS = {
+    'extend': BLUE,
+    'shrink': RED,
+    'speed_up': YELLOW,
+    'extra_life': GREEN,
+    'multi_ball': PURPLE
+}
+
+def build_power_up_table():
+    # Precomputes the weighted pick from POWERUP_CHANCES; call it again after
+    # changing the chances
+    global POWERUP_TYPES, POWERUP_CUM_WEIGHTS, POWERUP_SPAWN_CHANCE
+    POWERUP_TYPES = list(POWERUP_CHANCES)
+    POWERUP_CUM_WEIGHTS = list(itertools.accumulate(POWERUP_CHANCES.values()))
+    POWERUP_SPAWN_CHANCE = sum(POWERUP_CHANCES.values())
+
+build_power_up_table()
+
+# Speed factors a cloned ball picks from for each axis
+BALL_SPEED_JITTER = (0.8, 1, 1.2)
+
 # Brick types
 BRICK_TYPES = {
     'normal': {'hits': 1, 'color': WHITE, 'points': 10},
@@ -48,72 +94,160 @@ BRICK_TYPES = {
     'super': {'hits': 3, 'color': RED, 'points': 30}
 }
 
-# Level definitions
-LEVELS = {
-    'Classic': {
-        'description': 'Traditional rows of bricks',
-        'pattern': lambda: create_classic_pattern()
-    },
-    'Pyramid': {
-        'description': 'Triangular formation',
-        'pattern': lambda: create_pyramid_pattern()
-    },
-    'Diamond': {
-        'description': 'Diamond shaped pattern',
-        'pattern': lambda: create_diamond_pattern()
-    },
-    'Fortress': {
-        'description': 'Strong bricks surrounded by weak ones',
-        'pattern': lambda: create_fortress_pattern()
-    }
-}
+# Level definitions, filled from compiled level packs (see levelpack.py).
+# Each entry's pattern() decodes that level's bricks from the mapped pack.
+LEVELS = {}
+BUILTIN_LEVEL_PACK = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                  'levels', 'builtin.bbpack')
+
+# Input bits passed to GameState.step each frame
+INPUT_LEFT = 1
+INPUT_RIGHT = 2
+INPUT_LAUNCH = 4
+
+class App:
+    # Explicit bootstrap for the windowed game. Importing this module has no
+    # side effects beyond loading the level index; start() initialises only
+    # the pygame subsystems the game uses (display and font, no audio or
+    # joystick) and opens the window. Fonts and sprites load on first use.
+    # Every phase is timed from the start of the import for report().
+    def __init__(self, size=(WINDOW_WIDTH, WINDOW_HEIGHT), caption="Brick Breaker",
+                 startup_report=False):
+        # startup_report prints report() once the first frame is shown
+        self.size = size
+        self.caption = caption
+        self.startup_report = startup_report
+        self.surface = None
+        self.clock = None
+        self.phases = [('import', IMPORT_FINISHED - IMPORT_STARTED)]
+        self.last = IMPORT_FINISHED
+        self.first_frame_shown = False
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def start(self):
+        self.mark('setup')
+        pygame.display.init()
+        self.mark('display init')
+        pygame.font.init()
+        self.mark('font init')
+        self.surface = pygame.display.set_mode(self.size)
+        pygame.display.set_caption(self.caption)
+        self.clock = pygame.time.Clock()
+        self.mark('window')
+        return self.surface
+
+    def frame_shown(self):
+        # Called by SceneManager after each frame is presented
+        if not self.first_frame_shown:
+            self.first_frame_shown = True
+            self.mark('first frame')
+            if self.startup_report:
+                print(self.report())
+
+    def report(self):
+        lines = []
+        total = 0.0
+        for phase, seconds in self.phases:
+            total += seconds
+            lines.append(f"{phase:14s} {seconds * 1000:8.1f} ms {total * 1000:8.1f} ms")
+        return '\n'.join(lines)
+
+# Fonts are loaded once per (name, size) and shared by every caller
+fonts = {}
+
+def get_font(size, name=None):
+    key = (name, size)
+    font = fonts.get(key)
+    if font is None:
+        font = fonts[key] = pygame.font.Font(name, size)
+    return font
+
+class TextCache:
+    # LRU cache of rendered text surfaces keyed by (font, size, text, color).
+    # HUD and menu text rarely changes between frames, so most renders are hits.
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
 
-# Set up the game window
-screen = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
-pygame.display.set_caption("Brick Breaker")
-clock = pygame.time.Clock()
+    def render(self, text, size, color, font_name=None):
+        key = (font_name, size, text, color)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.hits += 1
+            self.surfaces.move_to_end(key)
+            return surface
+        self.misses += 1
+        surface = get_font(size, font_name).render(text, True, color)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.max_entries:
+            self.surfaces.popitem(last=False)
+        return surface
+
+    def clear(self):
+        self.surfaces.clear()
+        self.hits = 0
+        self.misses = 0
+
+text_cache = TextCache()
+
+def render_text(text, size, color):
+    return text_cache.render(text, size, color)
 
 class Button:
     def __init__(self, x, y, width, height, text, color):
         self.rect = pygame.Rect(x, y, width, height)
         self.text = text
         self.color = color
-        self.font = pygame.font.Font(None, 36)
+        self.font_size = 36
+        self.image = None
 
     def draw(self, surface):
-        pygame.draw.rect(surface, self.color, self.rect)
-        text_surface = self.font.render(self.text, True, BLACK)
-        text_rect = text_surface.get_rect(center=self.rect.center)
-        surface.blit(text_surface, text_rect)
+        # Buttons never change, so the filled rect and label are rendered once
+        if self.image is None:
+            self.image = pygame.Surface(self.rect.size, 0, surface)
+            self.image.fill(self.color)
+            text_surface = render_text(self.text, self.font_size, BLACK)
+            self.image.blit(text_surface, text_surface.get_rect(center=self.image.get_rect().center))
+        return surface.blit(self.image, self.rect)
 
     def is_clicked(self, pos):
         return self.rect.collidepoint(pos)
 
 class PowerUp:
-    def __init__(self, x, y):
+    # Pooled by GameState, so reset() re-initialises a spent power-up in place
+    __slots__ = ('rect', 'type', 'speed', 'prev_y', 'color')
+
+    def __init__(self, x, y, rng=random):
         self.rect = pygame.Rect(x, y, POWERUP_SIZE, POWERUP_SIZE)
-        # Choose power-up type based on weighted probabilities
-        power_up_type = random.choices(
-            list(POWERUP_CHANCES.keys()),
-            weights=list(POWERUP_CHANCES.values())
-        )[0]
-        self.type = power_up_type
         self.speed = POWERUP_SPEED
-        
-        # Set color based on power-up type
-        self.color = {
-            'extend': BLUE,
-            'shrink': RED,
-            'speed_up': YELLOW,
-            'extra_life': GREEN,
-            'multi_ball': PURPLE
-        }[self.type]
-    
+        self.reset(x, y, rng)
+
+    def reset(self, x, y, rng=random):
+        self.rect.topleft = (x, y)
+        # Choose power-up type based on weighted probabilities
+        self.type = rng.choices(POWERUP_TYPES, cum_weights=POWERUP_CUM_WEIGHTS)[0]
+        self.prev_y = y
+        self.color = POWERUP_COLORS[self.type]
+
     def move(self):
+        self.prev_y = self.rect.y
         self.rect.y += self.speed
     
-    def draw(self, surface):
-        pygame.draw.rect(surface, self.color, self.rect)
+    def sprite(self, atlas, alpha=1.0):
+        # (image, position) to blit, interpolated between the last two steps
+        rect = self.rect
+        if alpha < 1.0:
+            rect = rect.move(0, (self.prev_y - rect.y) * (1.0 - alpha))
+        return atlas.power_ups[self.type], rect.topleft
+
+    def draw(self, surface, alpha=1.0):
+        return surface.blit(*self.sprite(get_atlas(surface), alpha))
 
 class Paddle:
     def __init__(self):
@@ -123,6 +257,7 @@ class Paddle:
         self.y = WINDOW_HEIGHT - 40
         self.speed = 8
         self.rect = pygame.Rect(self.x, self.y, self.width, self.height)
+        self.prev_x = self.x
         self.power_up_timer = 0
 
     def apply_power_up(self, power_up_type):
@@ -148,11 +283,22 @@ class Paddle:
         self.x = max(0, min(self.x, WINDOW_WIDTH - self.width))
         self.rect.x = self.x
 
-    def draw(self, surface):
-        pygame.draw.rect(surface, WHITE, self.rect)
+    def sprite(self, atlas, alpha=1.0):
+        rect = self.rect
+        if alpha < 1.0:
+            rect = rect.move(round((self.prev_x - self.x) * (1.0 - alpha)), 0)
+        return atlas.paddle(rect.size), rect.topleft
+
+    def draw(self, surface, alpha=1.0):
+        return surface.blit(*self.sprite(get_atlas(surface), alpha))
 
 class Ball:
-    def __init__(self, paddle):
+    # Pooled by GameState: lost balls are kept and re-initialised by reset()
+    # or clone() instead of allocating a new ball and Rect
+    __slots__ = ('rng', 'radius', 'x', 'y', 'dx', 'dy', 'in_play', 'rect', 'prev_x', 'prev_y')
+
+    def __init__(self, paddle, rng=random):
+        self.rng = rng
         self.radius = BALL_SIZE // 2
         self.x = 0  # Initialize x and y to default values
         self.y = 0
@@ -167,229 +313,349 @@ class Ball:
             self.x = paddle.x + paddle.width // 2
             self.y = paddle.y - self.radius
             self.in_play = False
-            self.dx = random.choice([-1, 1]) * BALL_SPEED
+            self.dx = self.rng.choice([-1, 1]) * BALL_SPEED
             self.dy = -BALL_SPEED
-        self.rect = pygame.Rect(self.x - self.radius, self.y - self.radius, 
-                              self.radius * 2, self.radius * 2)
+        self.rect.update(self.x - self.radius, self.y - self.radius,
+                         self.radius * 2, self.radius * 2)
+        self.prev_x = self.x
+        self.prev_y = self.y
 
-    def clone(self):
-        new_ball = Ball(None)  # Create new ball without paddle
+    def clone(self, new_ball=None):
+        # Copies this ball in play into new_ball (a pooled ball) or a new one
+        if new_ball is None:
+            new_ball = Ball(None, self.rng)  # Create new ball without paddle
         new_ball.x = self.x    # Copy position from existing ball
         new_ball.y = self.y
-        new_ball.dx = self.dx * random.choice([0.8, 1, 1.2])  # Slightly different speeds
-        new_ball.dy = self.dy * random.choice([0.8, 1, 1.2])
-        new_ball.rect = pygame.Rect(new_ball.x - self.radius, new_ball.y - self.radius,
-                                  self.radius * 2, self.radius * 2)
+        new_ball.dx = self.dx * self.rng.choice(BALL_SPEED_JITTER)  # Slightly different speeds
+        new_ball.dy = self.dy * self.rng.choice(BALL_SPEED_JITTER)
+        new_ball.rect.update(new_ball.x - self.radius, new_ball.y - self.radius,
+                             self.radius * 2, self.radius * 2)
+        new_ball.prev_x = new_ball.x
+        new_ball.prev_y = new_ball.y
         new_ball.in_play = True
         return new_ball
 
-    def move(self):
+    def substeps(self):
+        return max(1, math.ceil(max(abs(self.dx), abs(self.dy)) / MAX_BALL_STEP))
+
+    def move(self, fraction=1.0):
         if not self.in_play:
             return
 
-        self.x += self.dx
-        self.y += self.dy
+        self.x += self.dx * fraction
+        self.y += self.dy * fraction
+
+        # Wall collisions: put the ball back inside and send it away from the
+        # wall, so a ball pushed past a wall (by a brick or paddle bounce)
+        # can't flip direction every frame and stay stuck there
+        if self.x <= self.radius:
+            self.x = self.radius
+            self.dx = abs(self.dx)
+        elif self.x >= WINDOW_WIDTH - self.radius:
+            self.x = WINDOW_WIDTH - self.radius
+            self.dx = -abs(self.dx)
+        if self.y <= self.radius:
+            self.y = self.radius
+            self.dy = abs(self.dy)
         self.rect.x = self.x - self.radius
         self.rect.y = self.y - self.radius
 
-        # Wall collisions
-        if self.x <= self.radius or self.x >= WINDOW_WIDTH - self.radius:
-            self.dx *= -1
-        if self.y <= self.radius:
-            self.dy *= -1
+    def sprite(self, atlas, alpha=1.0):
+        x = self.prev_x + (self.x - self.prev_x) * alpha
+        y = self.prev_y + (self.y - self.prev_y) * alpha
+        return atlas.ball, (int(x) - self.radius, int(y) - self.radius)
 
-    def draw(self, surface):
-        pygame.draw.circle(surface, WHITE, (int(self.x), int(self.y)), self.radius)
-
-class Brick:
-    def __init__(self, x, y, brick_type='normal'):
-        self.rect = pygame.Rect(x, y, BRICK_WIDTH, BRICK_HEIGHT)
-        self.type = brick_type
-        self.hits_left = BRICK_TYPES[brick_type]['hits']
-        self.points = BRICK_TYPES[brick_type]['points']
-        self.update_color()
-    
-    def hit(self):
-        self.hits_left -= 1
-        self.update_color()
-        return self.hits_left <= 0, self.points
-    
-    def update_color(self):
-        if self.type == 'normal':
-            self.color = BRICK_TYPES['normal']['color']
-        else:
-            # Gradient from red to orange to yellow based on hits left
-            if self.hits_left == 3:
-                self.color = RED
-            elif self.hits_left == 2:
-                self.color = ORANGE
-            else:
-                self.color = YELLOW
+    def draw(self, surface, alpha=1.0):
+        return surface.blit(*self.sprite(get_atlas(surface), alpha))
+
+# Brick type table indexed by a small type id; id 0 is an empty cell
+BRICK_TYPE_NAMES = [None] + list(BRICK_TYPES)
+BRICK_TYPE_IDS = {name: type_id for type_id, name in enumerate(BRICK_TYPE_NAMES) if name}
+BRICK_TYPE_HITS = [0] + [info['hits'] for info in BRICK_TYPES.values()]
+BRICK_TYPE_POINTS = [0] + [info['points'] for info in BRICK_TYPES.values()]
+
+def brick_color(brick_type, hits_left):
+    if brick_type == 'normal':
+        return BRICK_TYPES['normal']['color']
+    # Gradient from red to orange to yellow based on hits left
+    if hits_left == 3:
+        return RED
+    elif hits_left == 2:
+        return ORANGE
+    return YELLOW
+
+# BRICK_COLOR_TABLE[type_id][hits_left]
+BRICK_COLOR_TABLE = [[BLACK] * 4] + [
+    [brick_color(name, hits) for hits in range(4)] for name in BRICK_TYPE_NAMES[1:]
+]
+
+# Bricks sit on a fixed lattice: 2px gaps between columns, 5px between rows
+BRICK_PITCH_X = BRICK_WIDTH + 2
+BRICK_PITCH_Y = BRICK_HEIGHT + 5
+FIELD_TOP = 50
+
+class BrickField:
+    # The bricks of a level as a row-major grid of small ints: hits left and
+    # type id per cell, 0 meaning empty. A brick's rect is derived from its
+    # row and column, so a level costs two bytes per cell instead of a Python
+    # object and a Rect per brick. The grid doubles as the collision
+    # broadphase: a rect maps straight onto the cells it can touch.
+    endless = False
+    # Pixels scrolled and rows added since the start (see EndlessBrickField)
+    scrolled = 0
+    rows_generated = 0
+
+    def __init__(self, rows, cols, x=None, y=FIELD_TOP):
+        self.rows = rows
+        self.cols = cols
+        # By default the columns are centred in the window
+        self.x = x if x is not None else (WINDOW_WIDTH - (cols * BRICK_PITCH_X - 2)) // 2
+        self.y = y
+        self.right = self.x + cols * BRICK_PITCH_X
+        self.bottom = y + rows * BRICK_PITCH_Y
+        self.hits = bytearray(rows * cols)
+        self.types = bytearray(rows * cols)
+        self.count = 0
+
+    def place(self, row, col, brick_type='normal'):
+        index = row * self.cols + col
+        if not self.hits[index]:
+            self.count += 1
+        type_id = BRICK_TYPE_IDS[brick_type]
+        self.types[index] = type_id
+        self.hits[index] = BRICK_TYPE_HITS[type_id]
+
+    def copy(self):
+        field = BrickField(self.rows, self.cols, self.x, self.y)
+        field.hits[:] = self.hits
+        field.types[:] = self.types
+        field.count = self.count
+        return field
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        # Indices of the bricks still standing, in level order
+        hits = self.hits
+        return (index for index in range(len(hits)) if hits[index])
+
+    def rect(self, index):
+        row, col = divmod(index, self.cols)
+        return pygame.Rect(self.x + col * BRICK_PITCH_X, self.y + row * BRICK_PITCH_Y,
+                           BRICK_WIDTH, BRICK_HEIGHT)
+
+    def points(self, index):
+        return BRICK_TYPE_POINTS[self.types[index]]
+
+    def hit(self, index):
+        self.hits[index] -= 1
+        destroyed = self.hits[index] == 0
+        if destroyed:
+            self.count -= 1
+        return destroyed, BRICK_TYPE_POINTS[self.types[index]]
+
+    def query(self, rect):
+        # Indices of standing bricks whose rect overlaps `rect`, in level order
+        x, y = self.x, self.y
+        left, top, right, bottom = rect.left, rect.top, rect.right, rect.bottom
+        # Most balls are nowhere near the bricks
+        if bottom <= y or top >= self.bottom or right <= x or left >= self.right:
+            return []
+        first_row = max(0, (top - y) // BRICK_PITCH_Y)
+        last_row = min(self.rows - 1, (bottom - 1 - y) // BRICK_PITCH_Y)
+        first_col = max(0, (left - x) // BRICK_PITCH_X)
+        last_col = min(self.cols - 1, (right - 1 - x) // BRICK_PITCH_X)
+        # Skip a column or row the rect only touches through the gap after it
+        if left >= x + first_col * BRICK_PITCH_X + BRICK_WIDTH:
+            first_col += 1
+        if top >= y + first_row * BRICK_PITCH_Y + BRICK_HEIGHT:
+            first_row += 1
+        hits = self.hits
+        cols = self.cols
+        found = []
+        for row in range(first_row, last_row + 1):
+            base = row * cols
+            for index in range(base + first_col, base + last_col + 1):
+                if hits[index]:
+                    found.append(index)
+        return found
+
+    def sprite(self, atlas, index):
+        row, col = divmod(index, self.cols)
+        return (atlas.bricks[self.types[index]][self.hits[index]],
+                (self.x + col * BRICK_PITCH_X, self.y + row * BRICK_PITCH_Y))
+
+    def draw_brick(self, surface, index):
+        return surface.blit(*self.sprite(get_atlas(surface), index))
 
     def draw(self, surface):
-        pygame.draw.rect(surface, self.color, self.rect)
-        # Draw hit points indicator if more than 1 hit required
-        if self.hits_left > 1:
-            font = pygame.font.Font(None, 24)
-            text = font.render(str(self.hits_left), True, BLACK)
-            text_rect = text.get_rect(center=self.rect.center)
-            surface.blit(text, text_rect)
-
-def create_classic_pattern():
-    bricks = []
-    for row in range(BRICK_ROWS):
-        y = row * (BRICK_HEIGHT + 5) + 50
-        for col in range(BRICK_COLS):
-            x = col * (BRICK_WIDTH + 2) + (WINDOW_WIDTH - (BRICK_COLS * (BRICK_WIDTH + 2) - 2)) // 2
-            brick_type = 'normal'
-            if row < 2:  # Top two rows are tougher
-                brick_type = 'tough' if row == 0 else 'normal'
-            bricks.append(Brick(x, y, brick_type))
-    return bricks
-
-def create_pyramid_pattern():
-    bricks = []
-    max_cols = BRICK_COLS
-    for row in range(BRICK_ROWS):
-        cols = max_cols - row * 2
-        if cols <= 0:
-            break
-        y = row * (BRICK_HEIGHT + 5) + 50
-        start_x = (WINDOW_WIDTH - (cols * (BRICK_WIDTH + 2) - 2)) // 2
-        for col in range(cols):
-            x = start_x + col * (BRICK_WIDTH + 2)
-            brick_type = 'super' if row == 0 else 'tough' if row == 1 else 'normal'
-            bricks.append(Brick(x, y, brick_type))
-    return bricks
-
-def create_diamond_pattern():
-    bricks = []
-    max_rows = 7
-    max_cols = 7
-    center_row = max_rows // 2
-    center_col = max_cols // 2
-    
-    for row in range(max_rows):
-        y = row * (BRICK_HEIGHT + 5) + 50
-        for col in range(max_cols):
-            # Calculate distance from center
-            row_dist = abs(row - center_row)
-            col_dist = abs(col - center_col)
-            if row_dist + col_dist <= center_row:  # Diamond shape
-                x = (WINDOW_WIDTH - max_cols * (BRICK_WIDTH + 2)) // 2 + col * (BRICK_WIDTH + 2)
-                # Tougher bricks near the center
-                dist_from_center = row_dist + col_dist
-                if dist_from_center == 0:
-                    brick_type = 'super'
-                elif dist_from_center == 1:
-                    brick_type = 'tough'
-                else:
-                    brick_type = 'normal'
-                bricks.append(Brick(x, y, brick_type))
-    return bricks
-
-def create_fortress_pattern():
-    bricks = []
-    rows = 6
-    cols = 8
-    for row in range(rows):
-        y = row * (BRICK_HEIGHT + 5) + 50
-        for col in range(cols):
-            x = col * (BRICK_WIDTH + 2) + (WINDOW_WIDTH - (cols * (BRICK_WIDTH + 2) - 2)) // 2
-            # Create fortress pattern with tough bricks in the middle
-            if 1 <= row <= 4 and 2 <= col <= 5:
-                brick_type = 'super' if (row in [2, 3] and col in [3, 4]) else 'tough'
-            else:
-                brick_type = 'normal'
-            bricks.append(Brick(x, y, brick_type))
-    return bricks
+        atlas = get_atlas(surface)
+        surface.blits([self.sprite(atlas, index) for index in self], False)
 
-def show_start_screen():
-    play_button = Button(WINDOW_WIDTH//2 - 50, WINDOW_HEIGHT//2 - 25, 100, 50, "PLAY", GREEN)
-    
-    while True:
-        screen.fill(BLACK)
-        
-        # Draw title
-        font = pygame.font.Font(None, 74)
-        title = font.render("BRICK BREAKER", True, WHITE)
-        title_rect = title.get_rect(center=(WINDOW_WIDTH//2, WINDOW_HEIGHT//4))
-        screen.blit(title, title_rect)
-        
-        # Draw play button
-        play_button.draw(screen)
-        
-        pygame.display.flip()
-        
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                sys.exit()
-            if event.type == pygame.MOUSEBUTTONDOWN:
-                if play_button.is_clicked(event.pos):
-                    return True
-
-def show_game_over_screen(score):
-    retry_button = Button(WINDOW_WIDTH//2 - 100, WINDOW_HEIGHT//2 - 25, 200, 50, "Play Again", GREEN)
-    
-    while True:
-        screen.fill(BLACK)
-        
-        # Draw Game Over
-        font = pygame.font.Font(None, 74)
-        title = font.render("GAME OVER", True, RED)
-        title_rect = title.get_rect(center=(WINDOW_WIDTH//2, WINDOW_HEIGHT//4))
-        screen.blit(title, title_rect)
-        
-        # Draw final score
-        score_font = pygame.font.Font(None, 48)
-        score_text = score_font.render(f"Final Score: {score}", True, WHITE)
-        score_rect = score_text.get_rect(center=(WINDOW_WIDTH//2, WINDOW_HEIGHT//3))
-        screen.blit(score_text, score_rect)
-        
-        # Draw retry button
-        retry_button.draw(screen)
-        
-        pygame.display.flip()
-        
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                sys.exit()
-            if event.type == pygame.MOUSEBUTTONDOWN:
-                if retry_button.is_clicked(event.pos):
-                    return True
-
-def show_win_screen(score):
-    continue_button = Button(WINDOW_WIDTH//2 - 100, WINDOW_HEIGHT//2 - 25, 200, 50, "Play Again", GREEN)
-    
-    while True:
-        screen.fill(BLACK)
-        
-        # Draw Win message
-        font = pygame.font.Font(None, 74)
-        title = font.render("YOU WIN!", True, GREEN)
-        title_rect = title.get_rect(center=(WINDOW_WIDTH//2, WINDOW_HEIGHT//4))
-        screen.blit(title, title_rect)
-        
-        # Draw final score
-        score_font = pygame.font.Font(None, 48)
-        score_text = score_font.render(f"Final Score: {score}", True, WHITE)
-        score_rect = score_text.get_rect(center=(WINDOW_WIDTH//2, WINDOW_HEIGHT//3))
-        screen.blit(score_text, score_rect)
-        
-        # Draw continue button
-        continue_button.draw(screen)
-        
-        pygame.display.flip()
-        
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                sys.exit()
-            if event.type == pygame.MOUSEBUTTONDOWN:
-                if continue_button.is_clicked(event.pos):
-                    return True
+# Endless mode: the level played from the start screen's ENDLESS button
+ENDLESS_LEVEL = 'Endless'
+# Enough rows to reach down to the paddle zone (the paddle's top is at
+# WINDOW_HEIGHT - 40), leaving room for a ball to pass under the last one
+ENDLESS_ROWS = (WINDOW_HEIGHT - 40 - FIELD_TOP - BRICK_HEIGHT) // BRICK_PITCH_Y
+ENDLESS_COLS = 9
+ENDLESS_SCROLL_FRAMES = 6  # the field creeps down 1px every this many steps
+
+class EndlessBrickField(BrickField):
+    # A fixed window of rows creeping down the screen. Each time it has moved
+    # a whole row, the rows shift down one, the bottom row is retired as it
+    # reaches the paddle zone and a new row from the seeded generator enters
+    # at the top. Bricks keep their index within the window, so memory and
+    # the cost of a query stay the same however long a game runs.
+    endless = True
+
+    def __init__(self, seed=None, rows=ENDLESS_ROWS, cols=ENDLESS_COLS):
+        super().__init__(rows, cols)
+        self.start(seed)
+
+    def start(self, seed):
+        # Empties the field and refills its top half from a new generator
+        self.rng = random.Random(seed)
+        self.rows_generated = 0
+        self.scrolled = 0
+        self.hits[:] = bytes(len(self.hits))
+        self.types[:] = bytes(len(self.types))
+        self.count = 0
+        for _ in range(self.rows // 2):
+            self.push_row()
+
+    def copy(self):
+        field = EndlessBrickField.__new__(EndlessBrickField)
+        field.__dict__.update(self.__dict__)
+        field.hits = bytearray(self.hits)
+        field.types = bytearray(self.types)
+        field.rng = random.Random()
+        field.rng.setstate(self.rng.getstate())
+        return field
+
+    def next_row(self):
+        # Type ids for the next row; rows fill up and toughen as the game goes on
+        n = self.rows_generated
+        rng = self.rng
+        density = min(0.9, 0.4 + n / 200)
+        tough = min(0.35, n / 300)
+        strong = min(0.15, n / 800)
+        row = bytearray(self.cols)
+        for col in range(self.cols):
+            if rng.random() < density:
+                roll = rng.random()
+                name = 'super' if roll < strong else 'tough' if roll < strong + tough else 'normal'
+                row[col] = BRICK_TYPE_IDS[name]
+        return row
+
+    def push_row(self):
+        # Shifts every row down one and generates row 0. Returns how many
+        # bricks were still standing in the retired bottom row.
+        cols = self.cols
+        hits, types = self.hits, self.types
+        last = len(hits) - cols
+        lost = cols - hits.count(0, last)
+        hits[cols:] = hits[:last]
+        types[cols:] = types[:last]
+        row = self.next_row()
+        types[:cols] = row
+        hits[:cols] = row.translate(BRICK_HITS_BY_TYPE)
+        self.count += cols - row.count(0) - lost
+        self.rows_generated += 1
+        return lost
+
+    def scroll(self, pixels=1):
+        # Moves the field down. Returns None, or the bricks lost from the
+        # bottom row if a new row entered.
+        self.y += pixels
+        self.bottom += pixels
+        self.scrolled += pixels
+        if self.y < FIELD_TOP + BRICK_PITCH_Y:
+            return None
+        self.y -= BRICK_PITCH_Y
+        self.bottom -= BRICK_PITCH_Y
+        return self.push_row()
+
+class SpriteAtlas:
+    # Every brick (type, hits left), the ball and each power-up pre-rendered
+    # once in the pixel format of the surface they are drawn on, so a frame
+    # is a few batched Surface.blits calls instead of a draw call per object.
+    # Creating the sprites in the target's format is what convert() does for
+    # the screen, and also works for offscreen targets without a display.
+    def __init__(self, target):
+        self.target = target
+        self.bricks = [[None] * 4 for _ in BRICK_TYPE_NAMES]
+        for type_id in range(1, len(BRICK_TYPE_NAMES)):
+            for hits_left in range(1, BRICK_TYPE_HITS[type_id] + 1):
+                image = self.new_surface((BRICK_WIDTH, BRICK_HEIGHT))
+                image.fill(BRICK_COLOR_TABLE[type_id][hits_left])
+                # Draw hit points indicator if more than 1 hit required
+                if hits_left > 1:
+                    text = render_text(str(hits_left), 24, BLACK)
+                    image.blit(text, text.get_rect(center=image.get_rect().center))
+                self.bricks[type_id][hits_left] = image
+        radius = BALL_SIZE // 2
+        self.ball = self.new_surface((radius * 2, radius * 2))
+        self.ball.fill(BLACK)
+        pygame.draw.circle(self.ball, WHITE, (radius, radius), radius)
+        self.ball.set_colorkey(BLACK, pygame.RLEACCEL)
+        self.power_ups = {}
+        for power_up_type, color in POWERUP_COLORS.items():
+            self.power_ups[power_up_type] = self.new_surface((POWERUP_SIZE, POWERUP_SIZE))
+            self.power_ups[power_up_type].fill(color)
+        # The paddle changes width with power-ups; one sprite per size seen
+        self.paddles = {}
+
+    def new_surface(self, size):
+        return pygame.Surface(size, 0, self.target)
+
+    def paddle(self, size):
+        image = self.paddles.get(size)
+        if image is None:
+            image = self.paddles[size] = self.new_surface(size)
+            image.fill(WHITE)
+        return image
+
+# Atlases are built on first use, one per target pixel format
+atlases = {}
+
+def get_atlas(surface):
+    key = (surface.get_bitsize(), surface.get_masks())
+    atlas = atlases.get(key)
+    if atlas is None:
+        atlas = atlases[key] = SpriteAtlas(surface)
+    return atlas
+
+def pack_pattern(pack, index):
+    # Builds a level's BrickField straight from the pack's cell bytes
+    rows, cols, x, y, cells = pack.cells(index)
+    field = BrickField(rows, cols, x, y)
+    field.types[:] = bytes(cells).translate(pack.brick_type_ids)
+    field.hits[:] = field.types.translate(BRICK_HITS_BY_TYPE)
+    field.count = len(field.types) - field.types.count(0)
+    return field
+
+# bytes.translate table from a type id to its starting hits
+BRICK_HITS_BY_TYPE = bytes(BRICK_TYPE_HITS) + bytes(256 - len(BRICK_TYPE_HITS))
+
+def load_level_pack(path):
+    # Registers every level in a compiled pack in LEVELS, replacing levels of
+    # the same name. Only the pack's index is read here.
+    pack = levelpack.LevelPack(path)
+    type_ids = []
+    for name in pack.type_names:
+        if name is not None and name not in BRICK_TYPE_IDS:
+            raise levelpack.LevelError(f"{path}: unknown brick type {name!r}")
+        type_ids.append(BRICK_TYPE_IDS.get(name, 0))
+    pack.brick_type_ids = bytes(type_ids) + bytes(256 - len(type_ids))
+    for index in range(len(pack)):
+        LEVELS[pack.name(index)] = {
+            'description': pack.description(index),
+            'pattern': lambda index=index: pack_pattern(pack, index)
+        }
+    return pack
+
+load_level_pack(BUILTIN_LEVEL_PACK)
 
 def check_collision(ball, rect):
     if ball.rect.colliderect(rect):
@@ -405,176 +671,1600 @@ def check_collision(ball, rect):
         return True
     return False
 
-def show_level_select_screen():
-    buttons = []
-    y_start = WINDOW_HEIGHT // 4
-    for i, (level_name, level_info) in enumerate(LEVELS.items()):
-        button = Button(
-            WINDOW_WIDTH//2 - 150,
-            y_start + i * 80,
-            300,
-            60,
-            level_name,
-            GREEN
-        )
-        buttons.append((button, level_name))
-    
-    while True:
-        screen.fill(BLACK)
-        
-        # Draw title
-        font = pygame.font.Font(None, 74)
-        title = font.render("SELECT LEVEL", True, WHITE)
-        title_rect = title.get_rect(center=(WINDOW_WIDTH//2, 50))
-        screen.blit(title, title_rect)
-        
-        # Draw buttons and descriptions
-        desc_font = pygame.font.Font(None, 24)
-        for button, level_name in buttons:
-            button.draw(screen)
-            desc = desc_font.render(LEVELS[level_name]['description'], True, WHITE)
-            desc_rect = desc.get_rect(
-                midtop=(button.rect.centerx, button.rect.bottom + 5)
-            )
-            screen.blit(desc, desc_rect)
-        
-        pygame.display.flip()
-        
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                sys.exit()
-            if event.type == pygame.MOUSEBUTTONDOWN:
-                for button, level_name in buttons:
-                    if button.is_clicked(event.pos):
-                        return level_name
+class GameState:
+    # Pure simulation of one game. It owns every game object and never touches
+    # the screen or the event queue, so it can be stepped as fast as the CPU
+    # allows (headless tests, analytics) or driven by main() at 60 FPS.
+    def __init__(self, level_name='Classic', seed=None, bricks=None):
+        # bricks overrides the level's pattern with a custom BrickField
+        self.level_name = level_name
+        self.rng_seed = seed
+        self.rng = random.Random(seed)
+        self.paddle = Paddle()
+        self.balls = [Ball(self.paddle, self.rng)]  # List to hold multiple balls
+        if bricks is None:
+            if level_name == ENDLESS_LEVEL:
+                bricks = EndlessBrickField()
+            else:
+                bricks = LEVELS[level_name]['pattern']()
+        if bricks.endless:
+            bricks.start(self.rng.getrandbits(64))
+        self.bricks = bricks
+        self.power_ups = []
+        # Lost balls and spent power-ups, reused before allocating new ones
+        self.ball_pool = []
+        self.power_up_pool = []
+        # Indices of bricks hit since the renderer last looked, so it can
+        # redraw just those
+        self.changed_bricks = []
+        self.score = 0
+        self.lives = INITIAL_LIVES
+        self.frame = 0
+        self.game_over = False
+        self.won = False
+        # Session stats for the score store
+        self.power_ups_collected = 0
+        self.max_balls = 1
+        # Ball-vs-rect tests run so far (paddle plus broadphase candidates)
+        self.collision_tests = 0
+        # Optional FrameProfiler; every hook is skipped when this is None
+        self.profiler = None
 
-def main():
-    while True:
-        # Start with the start screen
-        if not show_start_screen():
-            break
-        
-        # Show level select screen
-        selected_level = show_level_select_screen()
-        
-        # Initialize game objects
-        paddle = Paddle()
-        ball = Ball(paddle)
-        balls = [ball]  # List to hold multiple balls
-        bricks = LEVELS[selected_level]['pattern']()
-        power_ups = []
-        score = 0
-        lives = INITIAL_LIVES
-        game_font = pygame.font.Font(None, 36)
-        
-        running = True
-        while running:
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    pygame.quit()
-                    sys.exit()
-                elif event.type == pygame.MOUSEBUTTONDOWN and not any(ball.in_play for ball in balls):
-                    for ball in balls:
-                        ball.in_play = True
-            
-            # Move paddle
-            keys = pygame.key.get_pressed()
-            if keys[pygame.K_LEFT]:
-                paddle.move(-1)
-            if keys[pygame.K_RIGHT]:
-                paddle.move(1)
-            
-            # Update paddle power-ups
-            paddle.update()
-            
-            # Update all balls
-            for ball in balls[:]:
-                if not ball.in_play:
-                    ball.x = paddle.x + paddle.width // 2
-                    ball.y = paddle.y - ball.radius
-                else:
-                    ball.move()
-                
-                # Check paddle collision for each ball
-                if check_collision(ball, paddle.rect):
-                    relative_intersect_x = (paddle.x + paddle.width/2) - ball.x
-                    normalized_intersect = relative_intersect_x / (paddle.width/2)
-                    bounce_angle = normalized_intersect * 60
-                    ball.dx = -BALL_SPEED * pygame.math.Vector2.from_polar((1, bounce_angle))[0]
-                    ball.dy = -abs(ball.dy)
-                
-                # Check brick collisions for each ball
-                for brick in bricks[:]:
-                    if check_collision(ball, brick.rect):
-                        destroyed, points = brick.hit()
-                        if destroyed:
-                            bricks.remove(brick)
-                            score += points
-                            # Chance to spawn power-up
-                            if random.random() < sum(POWERUP_CHANCES.values()):
-                                power_ups.append(PowerUp(brick.rect.centerx, brick.rect.centery))
-                
-                # Ball out of bounds
-                if ball.y > WINDOW_HEIGHT:
-                    balls.remove(ball)
-                    if len(balls) == 0:
-                        lives -= 1
-                        if lives <= 0:
-                            if show_game_over_screen(score):
-                                break
-                            else:
-                                running = False
-                        new_ball = Ball(paddle)
-                        balls.append(new_ball)
-            
-            # Update and check power-ups
-            for power_up in power_ups[:]:
-                power_up.move()
-                if power_up.rect.colliderect(paddle.rect):
-                    if power_up.type == 'extra_life':
-                        lives += 1
-                    elif power_up.type == 'multi_ball':
-                        # Create two new balls
-                        new_balls = []
-                        for _ in range(2):
-                            for existing_ball in balls:
-                                if existing_ball.in_play:
-                                    new_balls.append(existing_ball.clone())
-                        balls.extend(new_balls[:2])  # Add up to 2 new balls
-                    else:
-                        paddle.apply_power_up(power_up.type)
-                    power_ups.remove(power_up)
-                elif power_up.rect.top > WINDOW_HEIGHT:
-                    power_ups.remove(power_up)
-            
-            # Check win condition
-            if len(bricks) == 0:
-                if show_win_screen(score):
-                    break
-                else:
-                    running = False
-            
-            # Draw everything
-            screen.fill(BLACK)
-            paddle.draw(screen)
+    @property
+    def finished(self):
+        return self.game_over or self.won
+
+    def collide_ball(self, ball):
+        paddle = self.paddle
+        profiler = self.profiler
+
+        # Check paddle collision for each ball
+        if check_collision(ball, paddle.rect):
+            relative_intersect_x = (paddle.x + paddle.width/2) - ball.x
+            normalized_intersect = relative_intersect_x / (paddle.width/2)
+            bounce_angle = normalized_intersect * 60
+            ball.dx = -BALL_SPEED * pygame.math.Vector2.from_polar((1, bounce_angle))[0]
+            ball.dy = -abs(ball.dy)
+        if profiler is not None:
+            profiler.mark('balls')
+
+        # Check brick collisions for each ball against nearby bricks only
+        bricks = self.bricks
+        candidates = bricks.query(ball.rect)
+        self.collision_tests += len(candidates) + 1
+        for index in candidates:
+            rect = bricks.rect(index)
+            if check_collision(ball, rect):
+                destroyed, points = bricks.hit(index)
+                self.changed_bricks.append(index)
+                if destroyed:
+                    self.score += points
+                    # Chance to spawn power-up
+                    if self.rng.random() < POWERUP_SPAWN_CHANCE:
+                        self.power_ups.append(self.new_power_up(rect.centerx, rect.centery))
+        if profiler is not None:
+            profiler.mark('bricks')
+
+    def new_ball(self):
+        # A ball resting on the paddle, like Ball(paddle, rng)
+        if self.ball_pool:
+            ball = self.ball_pool.pop()
+            ball.reset(self.paddle)
+            return ball
+        return Ball(self.paddle, self.rng)
+
+    def new_power_up(self, x, y):
+        if self.power_up_pool:
+            power_up = self.power_up_pool.pop()
+            power_up.reset(x, y, self.rng)
+            return power_up
+        return PowerUp(x, y, self.rng)
+
+    def split_balls(self, count=2):
+        # Adds clones of the first `count` balls in play (cycling through them
+        # if fewer are in play). Earlier versions cloned every ball in play
+        # twice and kept the first `count`; the RNG draws of the discarded
+        # clones are still made so recorded replays play back the same.
+        balls = self.balls
+        in_play = [ball for ball in balls if ball.in_play]
+        sources = (in_play * count)[:count]
+        pool = self.ball_pool
+        for ball in sources:
+            balls.append(ball.clone(pool.pop() if pool else None))
+        choice = self.rng.choice
+        for _ in range(2 * len(in_play) - len(sources)):
+            choice(BALL_SPEED_JITTER)
+            choice(BALL_SPEED_JITTER)
+        if len(balls) > self.max_balls:
+            self.max_balls = len(balls)
+
+    def scroll_bricks(self):
+        # Endless mode: creep the field down and, when a new row enters,
+        # move the queued brick changes along with their bricks. Bricks left
+        # in the retired row are lost without scoring; only dropped balls
+        # cost lives, so a game lasts as long as the player keeps the ball.
+        if self.frame % ENDLESS_SCROLL_FRAMES:
+            return
+        bricks = self.bricks
+        if bricks.scroll() is None:
+            return
+        cols = bricks.cols
+        limit = len(bricks.hits) - cols
+        # Headless runs never drain changed_bricks, so drop repeats here to
+        # keep it bounded by the size of the field
+        self.changed_bricks[:] = dict.fromkeys(index + cols for index in self.changed_bricks
+                                               if index < limit)
+
+    def step(self, inputs=0):
+        if self.finished:
+            return
+        self.frame += 1
+        paddle = self.paddle
+        balls = self.balls
+        if self.bricks.endless:
+            self.scroll_bricks()
+
+        # Launch waiting balls
+        if inputs & INPUT_LAUNCH and not any(ball.in_play for ball in balls):
             for ball in balls:
-                ball.draw(screen)
-            for brick in bricks:
-                brick.draw(screen)
-            for power_up in power_ups:
-                power_up.draw(screen)
-            
-            # Draw score and lives
-            score_text = game_font.render(f"Score: {score}", True, WHITE)
-            lives_text = game_font.render(f"Lives: {lives}", True, WHITE)
-            balls_text = game_font.render(f"Balls: {len(balls)}", True, WHITE)
-            screen.blit(score_text, (10, 10))
-            screen.blit(lives_text, (WINDOW_WIDTH - 100, 10))
-            screen.blit(balls_text, (WINDOW_WIDTH - 100, 40))
-            
+                ball.in_play = True
+
+        # Move paddle
+        paddle.prev_x = paddle.x
+        if inputs & INPUT_LEFT:
+            paddle.move(-1)
+        if inputs & INPUT_RIGHT:
+            paddle.move(1)
+
+        # Update paddle power-ups
+        paddle.update()
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.mark('paddle')
+
+        # Update all balls. Lost balls go back to the pool and the survivors
+        # are compacted in place, keeping their order: collisions and RNG
+        # draws follow it, so it is part of what a replay reproduces.
+        count = len(balls)
+        kept = 0
+        respawn = False
+        for i in range(count):
+            ball = balls[i]
+            ball.prev_x = ball.x
+            ball.prev_y = ball.y
+            if not ball.in_play:
+                ball.x = paddle.x + paddle.width // 2
+                ball.y = paddle.y - ball.radius
+                self.collide_ball(ball)
+            else:
+                # Fast balls advance in substeps, each with its own collision checks
+                substeps = ball.substeps()
+                for _ in range(substeps):
+                    ball.move(1.0 / substeps)
+                    self.collide_ball(ball)
+
+            # Ball out of bounds
+            if ball.y > WINDOW_HEIGHT:
+                self.ball_pool.append(ball)
+                if kept == 0 and i == count - 1:
+                    self.lives -= 1
+                    if self.lives <= 0:
+                        self.game_over = True
+                        balls.clear()
+                        return
+                    respawn = True
+            else:
+                balls[kept] = ball
+                kept += 1
+        del balls[kept:]
+        if respawn:
+            balls.append(self.new_ball())
+
+        # Update and check power-ups, compacting the list the same way
+        power_ups = self.power_ups
+        kept = 0
+        for i in range(len(power_ups)):
+            power_up = power_ups[i]
+            power_up.move()
+            if power_up.rect.colliderect(paddle.rect):
+                self.power_ups_collected += 1
+                if power_up.type == 'extra_life':
+                    self.lives += 1
+                elif power_up.type == 'multi_ball':
+                    self.split_balls(2)
+                else:
+                    paddle.apply_power_up(power_up.type)
+                self.power_up_pool.append(power_up)
+            elif power_up.rect.top > WINDOW_HEIGHT:
+                self.power_up_pool.append(power_up)
+            else:
+                power_ups[kept] = power_up
+                kept += 1
+        del power_ups[kept:]
+        if profiler is not None:
+            profiler.mark('power_ups')
+
+        # Check win condition; an endless field is never cleared for good
+        if len(self.bricks) == 0 and not self.bricks.endless:
+            self.won = True
+
+class Replay:
+    # A recorded session: level, RNG seed and the input bits fed to every
+    # GameState.step, run-length encoded. The simulation is deterministic
+    # for a given seed and input stream, so this is enough to re-run a game
+    # exactly, on screen or headless.
+    MAGIC = b'BBRP'
+    VERSION = 1
+
+    def __init__(self, level_name, seed, runs=None):
+        self.level_name = level_name
+        self.seed = seed
+        self.runs = runs if runs is not None else []  # [inputs, count] pairs
+
+    @property
+    def frames(self):
+        return sum(count for _, count in self.runs)
+
+    def record(self, inputs):
+        if self.runs and self.runs[-1][0] == inputs:
+            self.runs[-1][1] += 1
+        else:
+            self.runs.append([inputs, 1])
+
+    def __iter__(self):
+        for inputs, count in self.runs:
+            for _ in range(count):
+                yield inputs
+
+    def truncate(self, frames):
+        # Keeps the inputs of the first `frames` steps, e.g. after a rewind
+        total = 0
+        for i, run in enumerate(self.runs):
+            total += run[1]
+            if total >= frames:
+                run[1] -= total - frames
+                del self.runs[i + 1 if run[1] else i:]
+                return
+
+    def to_bytes(self):
+        name = self.level_name.encode('utf-8')
+        out = bytearray(self.MAGIC)
+        out += struct.pack('<BQB', self.VERSION, self.seed, len(name))
+        out += name
+        out += struct.pack('<I', len(self.runs))
+        for inputs, count in self.runs:
+            out.append(inputs)
+            # Counts are LEB128 varints: one byte for runs under 128 frames
+            while count >= 0x80:
+                out.append(count & 0x7f | 0x80)
+                count >>= 7
+            out.append(count)
+        return bytes(out)
+
+    @classmethod
+    def from_bytes(cls, data):
+        # Malformed data of any kind raises ValueError
+        if data[:4] != cls.MAGIC:
+            raise ValueError("not a replay file")
+        try:
+            version, seed, name_length = struct.unpack_from('<BQB', data, 4)
+            if version != cls.VERSION:
+                raise ValueError(f"unsupported replay version {version}")
+            offset = 4 + struct.calcsize('<BQB')
+            if offset + name_length > len(data):
+                raise IndexError
+            level_name = data[offset:offset + name_length].decode('utf-8')
+            offset += name_length
+            (run_count,) = struct.unpack_from('<I', data, offset)
+            offset += 4
+            runs = []
+            for _ in range(run_count):
+                inputs = data[offset]
+                offset += 1
+                count = shift = 0
+                while True:
+                    byte = data[offset]
+                    offset += 1
+                    count |= (byte & 0x7f) << shift
+                    shift += 7
+                    if byte < 0x80:
+                        break
+                runs.append([inputs, count])
+        except (IndexError, struct.error):
+            raise ValueError("truncated replay file") from None
+        except UnicodeDecodeError:
+            raise ValueError("corrupt level name in replay file") from None
+        if offset != len(data):
+            raise ValueError("trailing data after replay")
+        return cls(level_name, seed, runs)
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            return cls.from_bytes(f.read())
+
+def run_replay(replay, profiler=None):
+    # Headless playback at full speed; returns the final GameState
+    state = GameState(replay.level_name, seed=replay.seed)
+    state.profiler = profiler
+    for inputs in replay:
+        if profiler is not None:
+            profiler.begin_frame(state.collision_tests)
+        state.step(inputs)
+        if profiler is not None:
+            profiler.end_frame(state.collision_tests)
+        if state.finished:
+            break
+    return state
+
+def unfold(x, dx, t, low, high):
+    # Where a ball at x moving dx per frame is after t frames, bouncing
+    # between walls at low and high, and its dx then. Reflecting the walls
+    # turns the path into a straight line: unfold, move, fold back.
+    span = high - low
+    if span <= 0:
+        return low, dx
+    u = (x - low + dx * t) % (2 * span)
+    if u <= span:
+        return low + u, dx
+    return low + 2 * span - u, -dx
+
+class TrajectoryPredictor:
+    # Works out where and when each ball will reach the paddle's height
+    # without stepping the simulation. Side walls are unfolded in closed
+    # form; with cast_bricks the path is also cast against the brick grid
+    # row by row, bouncing off the first standing brick each way. Side hits
+    # on bricks and paddle bounces are not modelled.
+    #
+    # A prediction holds until the ball's velocity changes, a brick it
+    # bounces off is destroyed or (in endless mode) the field moves, so it is
+    # cached per ball and most frames cost a dictionary lookup and a check
+    # that the ball is still on its line.
+    MAX_BOUNCES = 16
+
+    def __init__(self, cast_bricks=True):
+        self.cast_bricks = cast_bricks
+        self.cache = {}
+        self.state = None
+
+    def predict(self, state, ball):
+        # (landing x, frame it lands on) for a ball in play, or None if it
+        # never comes down
+        if state is not self.state:
+            self.cache.clear()
+            self.state = state
+        bricks = state.bricks
+        entry = self.cache.get(id(ball))
+        if (entry is not None and entry[0] is ball and entry[1] == ball.dx and entry[2] == ball.dy
+                and entry[8] == bricks.rows_generated and entry[9] == bricks.y):
+            elapsed = state.frame - entry[3]
+            hits = bricks.hits
+            if (abs(entry[4] + ball.dx * elapsed - ball.x) < 1
+                    and abs(entry[5] + ball.dy * elapsed - ball.y) < 1
+                    and all(hits[index] for index in entry[7])):
+                return entry[6]
+        blockers = []
+        landing = self.cast(state, ball, blockers)
+        if landing is not None:
+            landing = (landing[0], state.frame + landing[1])
+        self.cache[id(ball)] = (ball, ball.dx, ball.dy, state.frame, ball.x, ball.y,
+                                landing, blockers, bricks.rows_generated, bricks.y)
+        return landing
+
+    def cast(self, state, ball, blockers):
+        # (landing x, frames from now), or None. The bricks bounced off are
+        # appended to `blockers`.
+        radius = ball.radius
+        low, high = radius, WINDOW_WIDTH - radius
+        floor = state.paddle.y - radius
+        x, y, dx, dy = ball.x, ball.y, ball.dx, ball.dy
+        bricks = state.bricks if self.cast_bricks else None
+        t = 0.0
+        for _ in range(self.MAX_BOUNCES):
+            hit = None
+            if dy > 0:
+                # Down to the paddle, unless a brick is in the way
+                step = max(0.0, (floor - y) / dy)
+                if bricks is not None and y + radius <= bricks.bottom:
+                    hit = self.brick_below(bricks, x, y, dx, dy, radius, low, high)
+                if hit is None or hit[0] >= step:
+                    return unfold(x, dx, step, low, high)[0], t + step
+            elif dy < 0:
+                # Up to the top wall or the first brick
+                step = max(0.0, (y - radius) / -dy)
+                if bricks is not None:
+                    hit = self.brick_above(bricks, x, y, dx, dy, radius, low, high)
+            else:
+                return None
+            if hit is not None and hit[0] < step:
+                step = hit[0]
+                blockers.append(hit[1])
+            x, dx = unfold(x, dx, step, low, high)
+            y += dy * step
+            dy = -dy
+            t += step
+        return x, t
+
+    def brick_above(self, bricks, x, y, dx, dy, radius, low, high):
+        # (frames, brick index) until the ball's top meets the bottom of a
+        # standing brick, or None
+        top = y - radius
+        row = min(bricks.rows - 1, int((top - bricks.y - BRICK_HEIGHT) // BRICK_PITCH_Y))
+        while row >= 0:
+            t = (top - (bricks.y + row * BRICK_PITCH_Y + BRICK_HEIGHT)) / -dy
+            index = self.row_blocker(bricks, row, unfold(x, dx, t, low, high)[0], radius)
+            if index >= 0:
+                return t, index
+            row -= 1
+        return None
+
+    def brick_below(self, bricks, x, y, dx, dy, radius, low, high):
+        # Same for the ball's bottom meeting the top of a brick
+        bottom = y + radius
+        row = max(0, -int((bricks.y - bottom) // BRICK_PITCH_Y))
+        while row < bricks.rows:
+            t = (bricks.y + row * BRICK_PITCH_Y - bottom) / dy
+            index = self.row_blocker(bricks, row, unfold(x, dx, t, low, high)[0], radius)
+            if index >= 0:
+                return t, index
+            row += 1
+        return None
+
+    def row_blocker(self, bricks, row, x, radius):
+        # Index of the first standing brick in `row` overlapping
+        # [x - radius, x + radius], or -1
+        left = x - radius - bricks.x
+        right = x + radius - bricks.x
+        first = max(0, int(left // BRICK_PITCH_X))
+        last = min(bricks.cols - 1, int(right // BRICK_PITCH_X))
+        # Skip a column the ball only reaches through the gap after it
+        if left >= first * BRICK_PITCH_X + BRICK_WIDTH:
+            first += 1
+        hits = bricks.hits
+        base = row * bricks.cols
+        for index in range(base + first, base + last + 1):
+            if hits[index]:
+                return index
+        return -1
+
+class Autopilot:
+    # Paddle controller for headless runs and demos: a callable mapping a
+    # GameState to input bits, like benchmark.scripted_inputs. It launches,
+    # then moves under wherever the ball that lands first will come down.
+    def __init__(self, cast_bricks=True):
+        self.predictor = TrajectoryPredictor(cast_bricks)
+
+    def __call__(self, state):
+        paddle = state.paddle
+        inputs = INPUT_LAUNCH
+        target = None
+        first = None
+        # A falling ball below the bricks lands in exactly (floor - y) / dy
+        # frames. Any other ball can't land before it has turned at the
+        # bottom of the brick field at the lowest, so only the balls whose
+        # bound beats the best falling ball need a full prediction.
+        floor = paddle.y - BALL_SIZE // 2
+        below = state.bricks.bottom + BALL_SIZE // 2
+        for ball in state.balls:
+            dy = ball.dy
+            if dy > 0 and ball.in_play and ball.y >= below:
+                soonest = (floor - ball.y) / dy
+                if first is None or soonest < first:
+                    first = soonest
+                    target = ball
+        if target is not None:
+            radius = target.radius
+            target = unfold(target.x, target.dx, max(0.0, first), radius,
+                            WINDOW_WIDTH - radius)[0]
+        predict = self.predictor.predict
+        for ball in state.balls:
+            dy = ball.dy
+            if not ball.in_play or not dy or (dy > 0 and ball.y >= below):
+                continue
+            if dy > 0:
+                soonest = (floor - ball.y) / dy
+            else:
+                soonest = (ball.y + floor - 2 * min(ball.y, below)) / -dy
+            if first is not None and soonest >= first:
+                continue
+            landing = predict(state, ball)
+            if landing is not None and (first is None or landing[1] - state.frame < first):
+                target = landing[0]
+                first = landing[1] - state.frame
+        if target is None:
+            return inputs
+        center = paddle.x + paddle.width / 2
+        if target < center - paddle.speed:
+            inputs |= INPUT_LEFT
+        elif target > center + paddle.speed:
+            inputs |= INPUT_RIGHT
+        return inputs
+
+# Save states. A snapshot holds everything GameState.step reads: the
+# scalars, paddle, balls and power-ups packed into `data`, plus the brick
+# hits, the brick types and the RNG state as separate bytes. Those three
+# rarely change between frames, so capture() reuses the previous snapshot's
+# bytes when they compare equal and a rewind buffer only pays for frames
+# that differ.
+SNAPSHOT_STATE = struct.Struct('<IiiBBHHIH')  # frame, score, lives, game over, won, balls,
+                                              # power-ups, power-ups collected, max balls
+SNAPSHOT_PADDLE = struct.Struct('<ddddIii')   # x, prev_x, width, speed, power-up timer, rect x, width
+SNAPSHOT_BALL = struct.Struct('<dddddd?ii')   # x, y, dx, dy, prev_x, prev_y, in play, rect x, y
+SNAPSHOT_POWER_UP = struct.Struct('<iiiB')    # rect x, y, prev_y, type
+SNAPSHOT_RNG = struct.Struct('<625I?d')       # Mersenne Twister state, gauss_next
+SNAPSHOT_GRID = struct.Struct('<HHhh')        # brick rows, cols, x, y
+POWERUP_TYPE_NAMES = list(POWERUP_COLORS)
+POWERUP_TYPE_IDS = {name: type_id for type_id, name in enumerate(POWERUP_TYPE_NAMES)}
+
+class Snapshot:
+    MAGIC = b'BBSS'
+    VERSION = 2
+    __slots__ = ('level_name', 'frame', 'data', 'rng', 'grid', 'types', 'hits')
+
+    def __init__(self, level_name, frame, data, rng, grid, types, hits):
+        self.level_name = level_name
+        self.frame = frame
+        self.data = data
+        self.rng = rng
+        self.grid = grid    # (rows, cols, x, y) of the brick field
+        self.types = types
+        self.hits = hits
+
+    @classmethod
+    def capture(cls, state, previous=None):
+        # previous is the last snapshot taken, whose unchanged bytes are shared
+        paddle = state.paddle
+        balls = state.balls
+        power_ups = state.power_ups
+        parts = [
+            SNAPSHOT_STATE.pack(state.frame, state.score, state.lives, state.game_over,
+                                state.won, len(balls), len(power_ups),
+                                state.power_ups_collected, state.max_balls),
+            SNAPSHOT_PADDLE.pack(paddle.x, paddle.prev_x, paddle.width, paddle.speed,
+                                 paddle.power_up_timer, paddle.rect.x, paddle.rect.width),
+        ]
+        pack = SNAPSHOT_BALL.pack
+        for ball in balls:
+            parts.append(pack(ball.x, ball.y, ball.dx, ball.dy, ball.prev_x, ball.prev_y,
+                              ball.in_play, ball.rect.x, ball.rect.y))
+        pack = SNAPSHOT_POWER_UP.pack
+        for power_up in power_ups:
+            parts.append(pack(power_up.rect.x, power_up.rect.y, power_up.prev_y,
+                              POWERUP_TYPE_IDS[power_up.type]))
+
+        _, words, gauss_next = state.rng.getstate()
+        rng = SNAPSHOT_RNG.pack(*words, gauss_next is not None, gauss_next or 0.0)
+        bricks = state.bricks
+        grid = (bricks.rows, bricks.cols, bricks.x, bricks.y)
+        types = bricks.types
+        hits = bricks.hits
+        if previous is None:
+            types = bytes(types)
+            hits = bytes(hits)
+        else:
+            # Comparing a bytearray with bytes is a memcmp, far cheaper than
+            # keeping a copy
+            if rng == previous.rng:
+                rng = previous.rng
+            if grid == previous.grid:
+                grid = previous.grid
+            types = previous.types if types == previous.types else bytes(types)
+            hits = previous.hits if hits == previous.hits else bytes(hits)
+        return cls(state.level_name, state.frame, b''.join(parts), rng, grid, types, hits)
+
+    def restore(self, state):
+        # Winds `state` back (or forward) to this snapshot. Balls and
+        # power-ups come from the state's pools, and bricks whose hits differ
+        # are queued in changed_bricks for the renderer. A snapshot of
+        # another brick layout replaces state.bricks, which needs a renderer
+        # reset instead.
+        bricks = state.bricks
+        if (bricks.rows, bricks.cols, bricks.x, bricks.y) != self.grid or bricks.types != self.types:
+            bricks = state.bricks = BrickField(*self.grid)
+            bricks.types[:] = self.types
+        hits = bricks.hits
+        if hits != self.hits:
+            old = bytes(hits)
+            hits[:] = self.hits
+            state.changed_bricks.extend(index for index in range(len(hits))
+                                        if hits[index] != old[index])
+            bricks.count = len(hits) - hits.count(0)
+
+        data = self.data
+        (state.frame, state.score, state.lives, game_over, won, ball_count, power_up_count,
+         state.power_ups_collected, state.max_balls) = SNAPSHOT_STATE.unpack_from(data, 0)
+        state.game_over = bool(game_over)
+        state.won = bool(won)
+        state.level_name = self.level_name
+        offset = SNAPSHOT_STATE.size
+
+        paddle = state.paddle
+        (paddle.x, paddle.prev_x, paddle.width, paddle.speed, paddle.power_up_timer,
+         paddle.rect.x, paddle.rect.width) = SNAPSHOT_PADDLE.unpack_from(data, offset)
+        offset += SNAPSHOT_PADDLE.size
+
+        balls = state.balls
+        pool = state.ball_pool
+        pool.extend(balls)
+        balls.clear()
+        for _ in range(ball_count):
+            ball = pool.pop() if pool else Ball(None, state.rng)
+            (ball.x, ball.y, ball.dx, ball.dy, ball.prev_x, ball.prev_y,
+             ball.in_play, ball.rect.x, ball.rect.y) = SNAPSHOT_BALL.unpack_from(data, offset)
+            offset += SNAPSHOT_BALL.size
+            balls.append(ball)
+
+        power_ups = state.power_ups
+        pool = state.power_up_pool
+        pool.extend(power_ups)
+        power_ups.clear()
+        for _ in range(power_up_count):
+            # A new PowerUp draws its type from the RNG, which is restored below
+            power_up = pool.pop() if pool else PowerUp(0, 0, state.rng)
+            x, y, power_up.prev_y, type_id = SNAPSHOT_POWER_UP.unpack_from(data, offset)
+            offset += SNAPSHOT_POWER_UP.size
+            power_up.rect.topleft = (x, y)
+            power_up.type = POWERUP_TYPE_NAMES[type_id]
+            power_up.color = POWERUP_COLORS[power_up.type]
+            power_ups.append(power_up)
+
+        words = SNAPSHOT_RNG.unpack(self.rng)
+        state.rng.setstate((3, words[:625], words[626] if words[625] else None))
+
+    def to_state(self):
+        # A new GameState positioned at this snapshot
+        state = GameState(self.level_name, bricks=BrickField(*self.grid))
+        self.restore(state)
+        return state
+
+    def to_bytes(self):
+        name = self.level_name.encode('utf-8')
+        out = bytearray(self.MAGIC)
+        out += struct.pack('<BB', self.VERSION, len(name))
+        out += name
+        out += SNAPSHOT_GRID.pack(*self.grid)
+        out += struct.pack('<I', len(self.data))
+        out += self.data
+        out += self.rng
+        out += self.types
+        out += self.hits
+        return bytes(out)
+
+    @classmethod
+    def from_bytes(cls, data):
+        if data[:4] != cls.MAGIC:
+            raise ValueError("not a save state")
+        version, name_length = struct.unpack_from('<BB', data, 4)
+        if version != cls.VERSION:
+            raise ValueError(f"unsupported save state version {version}")
+        offset = 6
+        level_name = data[offset:offset + name_length].decode('utf-8')
+        offset += name_length
+        grid = SNAPSHOT_GRID.unpack_from(data, offset)
+        offset += SNAPSHOT_GRID.size
+        (length,) = struct.unpack_from('<I', data, offset)
+        offset += 4
+        body = data[offset:offset + length]
+        offset += length
+        rng = data[offset:offset + SNAPSHOT_RNG.size]
+        offset += SNAPSHOT_RNG.size
+        cells = grid[0] * grid[1]
+        types = data[offset:offset + cells]
+        hits = data[offset + cells:offset + 2 * cells]
+        if len(hits) != cells:
+            raise ValueError("truncated save state")
+        (frame,) = struct.unpack_from('<I', body, 0)
+        return cls(level_name, frame, body, rng, grid, types, hits)
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            return cls.from_bytes(f.read())
+
+# Seconds of play GameScene keeps for rewinding, and where F5 saves to
+REWIND_SECONDS = 10
+QUICKSAVE_PATH = 'quicksave.bbs'
+
+class RewindBuffer:
+    # Ring of the last `capacity` snapshots, one per simulation step; the
+    # oldest is overwritten once it is full
+    def __init__(self, capacity=REWIND_SECONDS * SIM_HZ):
+        self.slots = [None] * capacity
+        self.start = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def latest(self):
+        if not self.count:
+            return None
+        return self.slots[(self.start + self.count - 1) % len(self.slots)]
+
+    def capture(self, state):
+        snapshot = Snapshot.capture(state, self.latest)
+        self.push(snapshot)
+        return snapshot
+
+    def push(self, snapshot):
+        slots = self.slots
+        if self.count < len(slots):
+            slots[(self.start + self.count) % len(slots)] = snapshot
+            self.count += 1
+        else:
+            slots[self.start] = snapshot
+            self.start = (self.start + 1) % len(slots)
+
+    def rewind(self, steps=1):
+        # Drops the newest `steps` snapshots, keeping at least one, and
+        # returns the one that is now the latest
+        slots = self.slots
+        steps = min(steps, self.count - 1)
+        for _ in range(max(0, steps)):
+            self.count -= 1
+            slots[(self.start + self.count) % len(slots)] = None
+        return self.latest
+
+    def clear(self):
+        self.slots = [None] * len(self.slots)
+        self.start = 0
+        self.count = 0
+
+    def memory(self):
+        # Bytes held, counting each shared bytes object once
+        seen = set()
+        total = 0
+        for snapshot in self.slots:
+            if snapshot is None:
+                continue
+            for part in (snapshot.data, snapshot.rng, snapshot.types, snapshot.hits):
+                if id(part) not in seen:
+                    seen.add(id(part))
+                    total += len(part)
+        return total
+
+class FrameProfiler:
+    # Lap timer for the phases of a frame. mark(phase) bills the time since
+    # the previous mark to that phase; end_frame() closes the frame and keeps
+    # a rolling window for percentiles. Nothing calls into it unless a
+    # profiler is attached, so a disabled profiler costs nothing.
+    PHASES = ('input', 'paddle', 'balls', 'bricks', 'power_ups', 'draw')
+
+    def __init__(self, window=600, keep_history=False):
+        self.frame_times = deque(maxlen=window)
+        self.collision_counts = deque(maxlen=window)
+        self.phase_totals = dict.fromkeys(self.PHASES, 0.0)
+        self.current = dict.fromkeys(self.PHASES, 0.0)
+        # Full per-frame rows are only kept when they'll be exported
+        self.history = [] if keep_history else None
+        self.frames = 0
+        self.frame_start = self.last = time.perf_counter()
+        self.collision_start = 0
+
+    def begin_frame(self, collision_tests=0):
+        self.frame_start = self.last = time.perf_counter()
+        self.collision_start = collision_tests
+        for phase in self.current:
+            self.current[phase] = 0.0
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.current[phase] += now - self.last
+        self.last = now
+
+    def end_frame(self, collision_tests=0):
+        total = time.perf_counter() - self.frame_start
+        tests = collision_tests - self.collision_start
+        self.frames += 1
+        self.frame_times.append(total)
+        self.collision_counts.append(tests)
+        for phase, elapsed in self.current.items():
+            self.phase_totals[phase] += elapsed
+        if self.history is not None:
+            self.history.append((self.frames, total, tests, *self.current.values()))
+
+    def percentile(self, fraction):
+        if not self.frame_times:
+            return 0.0
+        ordered = sorted(self.frame_times)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def summary(self):
+        frames = max(1, self.frames)
+        return {
+            'frames': self.frames,
+            'frame_ms': {
+                'p50': self.percentile(0.50) * 1000,
+                'p95': self.percentile(0.95) * 1000,
+                'p99': self.percentile(0.99) * 1000,
+            },
+            'phase_ms': {phase: total / frames * 1000
+                         for phase, total in self.phase_totals.items()},
+            'collision_tests_per_frame': (sum(self.collision_counts)
+                                          / max(1, len(self.collision_counts))),
+        }
+
+    def dump(self, path):
+        if path.endswith('.csv'):
+            with open(path, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['frame', 'frame_ms', 'collision_tests',
+                                 *(f'{phase}_ms' for phase in self.PHASES)])
+                for frame, total, tests, *phases in self.history or []:
+                    writer.writerow([frame, round(total * 1000, 4), tests,
+                                     *(round(t * 1000, 4) for t in phases)])
+        else:
+            with open(path, 'w') as f:
+                json.dump(self.summary(), f, indent=2)
+
+class ProfilerOverlay:
+    # Small stats panel in the top-left corner, toggled with F3. The text is
+    # refreshed a few times a second so the text cache isn't flooded.
+    REFRESH_FRAMES = 30
+
+    def __init__(self, profiler):
+        self.profiler = profiler
+        self.visible = False
+        self.lines = []
+
+    def draw(self, surface):
+        if not self.visible:
+            return []
+        profiler = self.profiler
+        if not self.lines or profiler.frames % self.REFRESH_FRAMES == 0:
+            stats = profiler.summary()
+            frame_ms = stats['frame_ms']
+            self.lines = [
+                "frame p50 {p50:.2f} p95 {p95:.2f} p99 {p99:.2f} ms".format(**frame_ms),
+                f"collision tests/frame {stats['collision_tests_per_frame']:.0f}",
+            ] + [f"{phase:9s} {ms:.3f} ms" for phase, ms in stats['phase_ms'].items()]
+        rects = []
+        y = 70
+        for line in self.lines:
+            text = render_text(line, 20, GREEN)
+            rects.append(surface.fill(BLACK, text.get_rect(topleft=(10, y))))
+            surface.blit(text, (10, y))
+            y += 16
+        return rects
+
+def draw_hud(surface, state):
+    # Draw score and lives
+    score_text = render_text(f"Score: {state.score}", 36, WHITE)
+    lives_text = render_text(f"Lives: {state.lives}", 36, WHITE)
+    balls_text = render_text(f"Balls: {len(state.balls)}", 36, WHITE)
+    return surface.blits([
+        (score_text, (10, 10)),
+        (lives_text, (WINDOW_WIDTH - 100, 10)),
+        (balls_text, (WINDOW_WIDTH - 100, 40)),
+    ])
+
+def object_sprites(state, atlas, alpha=1.0):
+    # (image, position) pairs for the paddle, balls and power-ups, in the
+    # order they are drawn
+    sprites = [state.paddle.sprite(atlas, alpha)]
+    sprites.extend(ball.sprite(atlas, alpha) for ball in state.balls)
+    sprites.extend(power_up.sprite(atlas, alpha) for power_up in state.power_ups)
+    return sprites
+
+def draw_game(surface, state, alpha=1.0):
+    # alpha interpolates moving objects between the last two simulation steps
+    atlas = get_atlas(surface)
+    surface.fill(BLACK)
+    paddle_and_balls = 1 + len(state.balls)
+    sprites = object_sprites(state, atlas, alpha)
+    surface.blits(sprites[:paddle_and_balls], False)
+    state.bricks.draw(surface)
+    surface.blits(sprites[paddle_and_balls:], False)
+    draw_hud(surface, state)
+
+class FullRenderer:
+    # Original path: clear and redraw the whole scene, then flip
+    def __init__(self, surface):
+        self.surface = surface
+        # Objects with draw(surface) -> rects, drawn on top of the scene
+        self.overlays = []
+
+    def reset(self, state):
+        state.changed_bricks.clear()
+
+    def draw(self, state, alpha=1.0):
+        state.changed_bricks.clear()
+        draw_game(self.surface, state, alpha)
+        for overlay in self.overlays:
+            overlay.draw(self.surface)
+        pygame.display.flip()
+
+class DirtyRectRenderer:
+    # Bricks are baked into an offscreen layer that only changes when a brick
+    # is hit. Moving objects and the HUD are erased by copying the layer back
+    # over last frame's rects, redrawn, and only those rects are pushed to the
+    # display.
+    def __init__(self, surface):
+        self.surface = surface
+        self.layer = pygame.Surface(surface.get_size(), 0, surface)
+        self.atlas = get_atlas(surface)
+        self.overlays = []
+        self.previous = []
+        self.hud = None
+        self.hud_rects = []
+        self.scrolled = 0
+        self.rows_generated = 0
+
+    def reset(self, state):
+        self.layer.fill(BLACK)
+        state.bricks.draw(self.layer)
+        state.changed_bricks.clear()
+        self.scrolled = state.bricks.scrolled
+        self.rows_generated = state.bricks.rows_generated
+        self.previous = []
+        self.hud = None
+        self.hud_rects = []
+        self.surface.blit(self.layer, (0, 0))
+        self.present()
+
+    def present(self, rects=None):
+        # Pushes the changed rects (or the whole surface) to the display
+        if rects is None:
             pygame.display.flip()
-            clock.tick(60)
+        else:
+            pygame.display.update(rects)
+
+    def scroll_layer(self, bricks):
+        # Endless mode: shifts the baked bricks down as far as the field has
+        # scrolled, draws only the rows that entered since and clears what
+        # went off the bottom. Returns the area that changed.
+        layer = self.layer
+        area = pygame.Rect(bricks.x, FIELD_TOP, bricks.right - bricks.x,
+                           (bricks.rows + 1) * BRICK_PITCH_Y)
+        layer.set_clip(area)
+        layer.scroll(0, bricks.scrolled - self.scrolled)
+        layer.set_clip(None)
+        layer.fill(BLACK, (area.x, area.y, area.width, bricks.y - area.y))
+        layer.fill(BLACK, (area.x, bricks.bottom, area.width, area.bottom - bricks.bottom))
+        new_rows = min(bricks.rows, bricks.rows_generated - self.rows_generated)
+        if new_rows:
+            layer.fill(BLACK, (area.x, bricks.y, area.width, new_rows * BRICK_PITCH_Y))
+            hits = bricks.hits
+            layer.blits([bricks.sprite(self.atlas, index)
+                         for index in range(new_rows * bricks.cols) if hits[index]], False)
+        self.scrolled = bricks.scrolled
+        self.rows_generated = bricks.rows_generated
+        return area
+
+    def draw_objects(self, bricks, sprites, balls_end):
+        # Blits object sprites in the order of a full redraw: the paddle and
+        # balls (the first balls_end sprites), the bricks overlapping them on
+        # top, then power-ups. Returns the objects' rects.
+        surface = self.surface
+        rects = surface.blits(sprites[:balls_end])
+        field = pygame.Rect(bricks.x, bricks.y, bricks.right - bricks.x, bricks.bottom - bricks.y)
+        query, atlas = bricks.query, self.atlas
+        covering = [bricks.sprite(atlas, index)
+                    for i in field.collidelistall(rects) for index in query(rects[i])]
+        if covering:
+            surface.blits(covering, False)
+        rects.extend(surface.blits(sprites[balls_end:]))
+        return rects
+
+    def draw(self, state, alpha=1.0):
+        surface = self.surface
+        dirty = self.previous
+
+        bricks = state.bricks
+        layer = self.layer
+        atlas = self.atlas
+        if bricks.scrolled != self.scrolled:
+            dirty.append(self.scroll_layer(bricks))
+
+        # Re-render only the bricks whose hits_left changed
+        if state.changed_bricks:
+            standing = []
+            for index in state.changed_bricks:
+                rect = bricks.rect(index)
+                layer.fill(BLACK, rect)
+                if bricks.hits[index]:
+                    standing.append(bricks.sprite(atlas, index))
+                dirty.append(rect)
+            layer.blits(standing, False)
+            state.changed_bricks.clear()
+
+        for rect in dirty:
+            surface.blit(self.layer, rect, rect)
+
+        sprites = object_sprites(state, atlas, alpha)
+        balls_end = 1 + len(state.balls)
+        current = self.draw_objects(bricks, sprites, balls_end)
+
+        # The HUD only needs redrawing when its text changed or something
+        # was drawn or erased underneath it. It is drawn over the objects,
+        # as in a full redraw, so clearing it puts back the objects it
+        # covers first. Its rects stay out of `previous`, which would
+        # otherwise make the next frame redraw it again.
+        hud = (state.score, state.lives, len(state.balls))
+        hud_rects = self.hud_rects
+        if hud != self.hud or any(rect.collidelist(dirty) != -1 or rect.collidelist(current) != -1
+                                  for rect in hud_rects):
+            for rect in hud_rects:
+                surface.blit(layer, rect, rect)
+            covered = [i for i, rect in enumerate(current) if rect.collidelist(hud_rects) != -1]
+            if covered:
+                self.draw_objects(bricks, [sprites[i] for i in covered],
+                                  sum(i < balls_end for i in covered))
+            self.hud_rects = draw_hud(surface, state)
+            self.hud = hud
+            dirty.extend(hud_rects)
+            dirty.extend(self.hud_rects)
+
+        for overlay in self.overlays:
+            current.extend(overlay.draw(surface))
+
+        self.present(dirty + current)
+        self.previous = current
+
+class OffscreenRenderer(DirtyRectRenderer):
+    # Draws the same scene into a Surface of its own and never touches the
+    # display, for recording, thumbnails and ML pipelines. frame() exposes
+    # the pixels as a numpy view without copying them. With observation_size
+    # set, observation() also scales the frame into a small preallocated
+    # surface and, with grayscale, converts it into a preallocated array, so
+    # no frame allocates pixel buffers.
+    def __init__(self, observation_size=None, grayscale=False):
+        pygame.font.init()  # HUD text; no window is needed
+        super().__init__(pygame.Surface((WINDOW_WIDTH, WINDOW_HEIGHT)))
+        self.observation_size = observation_size
+        self.grayscale = grayscale
+        if observation_size is not None:
+            width, height = observation_size
+            self.small = pygame.Surface(observation_size, 0, self.surface)
+            # smoothscale writes through this view's lock, so it can be kept
+            self.small_pixels = pygame.surfarray.pixels3d(self.small).transpose(1, 0, 2)
+            if grayscale:
+                self.gray = np.empty((height, width), np.uint8)
+                self.gray_sum = np.empty((height, width), np.uint16)
+                self.gray_term = np.empty((height, width), np.uint16)
+
+    def present(self, rects=None):
+        pass
+
+    def frame(self):
+        # (height, width, 3) uint8 view of the rendered frame. It locks the
+        # surface, so drop it before the next draw().
+        return pygame.surfarray.pixels3d(self.surface).transpose(1, 0, 2)
+
+    def observation(self):
+        # The frame at observation_size: (height, width, 3), or (height,
+        # width) with grayscale. The returned array is reused by the next call.
+        if self.observation_size is None:
+            return self.frame()
+        pygame.transform.smoothscale(self.surface, self.observation_size, self.small)
+        if not self.grayscale:
+            return self.small_pixels
+        # ITU-R 601 luma in 8.8 fixed point: (77 R + 150 G + 29 B) >> 8
+        pixels = self.small_pixels
+        total, term = self.gray_sum, self.gray_term
+        np.multiply(pixels[..., 0], 77, out=total, dtype=np.uint16)
+        np.multiply(pixels[..., 1], 150, out=term, dtype=np.uint16)
+        total += term
+        np.multiply(pixels[..., 2], 29, out=term, dtype=np.uint16)
+        total += term
+        np.right_shift(total, 8, out=self.gray, casting='unsafe')
+        return self.gray
+
+RENDERERS = {
+    'full': FullRenderer,
+    'dirty': DirtyRectRenderer,
+}
+
+def read_inputs(events):
+    inputs = 0
+    for event in events:
+        if event.type == pygame.MOUSEBUTTONDOWN:
+            inputs |= INPUT_LAUNCH
+    keys = pygame.key.get_pressed()
+    if keys[pygame.K_LEFT]:
+        inputs |= INPUT_LEFT
+    if keys[pygame.K_RIGHT]:
+        inputs |= INPUT_RIGHT
+    return inputs
+
+# Menus sleep in pygame.event.wait for at most this long before checking in
+MENU_WAIT_MS = 500
+
+class Scene:
+    # One screen of the game driven by SceneManager. Menu scenes are not
+    # animated: the manager blocks on input and only redraws them when
+    # `dirty` is set. Animated scenes get update() and draw() every tick.
+    animated = False
+
+    def __init__(self):
+        self.dirty = True
+        self.next_scene = None
+
+    def enter(self, manager):
+        self.manager = manager
+        self.dirty = True
+
+    def handle_event(self, event):
+        pass
+
+    def update(self, dt):
+        pass
+
+    def draw(self, surface):
+        pass
+
+    def switch_to(self, scene):
+        self.next_scene = scene
+
+class MenuScene(Scene):
+    # Title, optional score line and a column of buttons
+    title = ""
+    title_color = WHITE
+    title_y = WINDOW_HEIGHT // 4
+
+    def __init__(self, score=None):
+        super().__init__()
+        self.score = score
+        self.buttons = []
+
+    def handle_event(self, event):
+        if event.type == pygame.MOUSEBUTTONDOWN:
+            for button in self.buttons:
+                if button.is_clicked(event.pos):
+                    self.on_click(button)
+                    return
+
+    def on_click(self, button):
+        pass
+
+    def draw(self, surface):
+        surface.fill(BLACK)
+        title = render_text(self.title, 74, self.title_color)
+        surface.blit(title, title.get_rect(center=(WINDOW_WIDTH//2, self.title_y)))
+        if self.score is not None:
+            score_text = render_text(f"Final Score: {self.score}", 48, WHITE)
+            surface.blit(score_text, score_text.get_rect(center=(WINDOW_WIDTH//2, WINDOW_HEIGHT//3)))
+        for button in self.buttons:
+            button.draw(surface)
+
+class StartScene(MenuScene):
+    title = "BRICK BREAKER"
+
+    def __init__(self):
+        super().__init__()
+        self.play_button = Button(WINDOW_WIDTH//2 - 50, WINDOW_HEIGHT//2 - 25, 100, 50, "PLAY", GREEN)
+        self.endless_button = Button(WINDOW_WIDTH//2 - 75, WINDOW_HEIGHT//2 + 45, 150, 50,
+                                     "ENDLESS", YELLOW)
+        self.buttons = [self.play_button, self.endless_button]
+
+    def on_click(self, button):
+        if button is self.endless_button:
+            self.switch_to(GameScene(ENDLESS_LEVEL))
+        else:
+            self.switch_to(LevelSelectScene())
+
+# Level buttons shown per page of the level select screen
+LEVELS_PER_PAGE = 4
+
+class LevelSelectScene(MenuScene):
+    title = "SELECT LEVEL"
+    title_y = 50
+
+    def __init__(self, page=0):
+        super().__init__()
+        names = list(LEVELS)
+        pages = max(1, -(-len(names) // LEVELS_PER_PAGE))
+        self.page = min(page, pages - 1)
+        first = self.page * LEVELS_PER_PAGE
+        y_start = WINDOW_HEIGHT // 4
+        for i, level_name in enumerate(names[first:first + LEVELS_PER_PAGE]):
+            self.buttons.append(
+                Button(WINDOW_WIDTH//2 - 150, y_start + i * 80, 300, 60, level_name, GREEN))
+        self.prev_button = self.next_button = None
+        if self.page > 0:
+            self.prev_button = Button(50, WINDOW_HEIGHT - 80, 120, 50, "Prev", YELLOW)
+            self.buttons.append(self.prev_button)
+        if self.page < pages - 1:
+            self.next_button = Button(WINDOW_WIDTH - 170, WINDOW_HEIGHT - 80, 120, 50, "Next", YELLOW)
+            self.buttons.append(self.next_button)
+        self.page_label = f"Page {self.page + 1} of {pages}" if pages > 1 else None
+
+    def on_click(self, button):
+        if button is self.prev_button:
+            self.switch_to(LevelSelectScene(self.page - 1))
+        elif button is self.next_button:
+            self.switch_to(LevelSelectScene(self.page + 1))
+        else:
+            self.switch_to(GameScene(button.text))
+
+    def draw(self, surface):
+        super().draw(surface)
+        for button in self.buttons:
+            if button is self.prev_button or button is self.next_button:
+                continue
+            desc = render_text(LEVELS[button.text]['description'], 24, WHITE)
+            surface.blit(desc, desc.get_rect(midtop=(button.rect.centerx, button.rect.bottom + 5)))
+        if self.page_label:
+            label = render_text(self.page_label, 24, WHITE)
+            surface.blit(label, label.get_rect(center=(WINDOW_WIDTH//2, WINDOW_HEIGHT - 55)))
+
+# Rows of the leaderboard on the end screens
+LEADERBOARD_SIZE = 5
+
+class GameOverScene(MenuScene):
+    title = "GAME OVER"
+    title_color = RED
+
+    def __init__(self, score, session=None):
+        # session is the finished game as recorded in the score store
+        super().__init__(score)
+        self.session = session
+        self.leaderboard = []
+        self.buttons = [Button(WINDOW_WIDTH//2 - 100, WINDOW_HEIGHT//2 - 25, 200, 50, "Play Again", GREEN)]
+
+    def enter(self, manager):
+        super().enter(manager)
+        if self.session is not None and manager.scores is not None:
+            self.leaderboard = manager.scores.top(self.session['level'], LEADERBOARD_SIZE)
+
+    def on_click(self, button):
+        self.switch_to(StartScene())
+
+    def draw(self, surface):
+        super().draw(surface)
+        if not self.leaderboard:
+            return
+        y = WINDOW_HEIGHT//2 + 60
+        heading = render_text(f"Best on {self.session['level']}", 32, WHITE)
+        surface.blit(heading, heading.get_rect(center=(WINDOW_WIDTH//2, y)))
+        for rank, session in enumerate(self.leaderboard, 1):
+            y += 30
+            # This game's row stands out (it may not be committed yet, so
+            # match on its fields rather than identity)
+            mine = (session['finished_at'] == self.session['finished_at']
+                    and session['score'] == self.session['score'])
+            seconds = int(session['duration'])
+            line = render_text(f"{rank}.  {session['score']:6d}   {seconds // 60}:{seconds % 60:02d}",
+                               28, YELLOW if mine else WHITE)
+            surface.blit(line, line.get_rect(center=(WINDOW_WIDTH//2, y)))
+
+class WinScene(GameOverScene):
+    title = "YOU WIN!"
+    title_color = GREEN
+
+class GameScene(Scene):
+    # Physics runs at a fixed SIM_HZ whatever the display rate: real frame
+    # time is banked in an accumulator and spent in whole SIM_DT steps, and
+    # the leftover fraction is used to interpolate what gets drawn.
+    # Every step is also snapshotted into a rewind buffer: holding Backspace
+    # plays the game backwards, F5 saves the current state and F9 loads it.
+    animated = True
+
+    def __init__(self, level_name, replay=None):
+        # With a replay the recorded inputs drive the game instead of the player
+        super().__init__()
+        self.playback = replay
+        if replay is not None:
+            self.state = GameState(replay.level_name, seed=replay.seed)
+            self.replay_inputs = iter(replay)
+        else:
+            seed = random.randrange(2 ** 63)
+            self.state = GameState(level_name, seed=seed)
+        self.recording = None
+        self.rewind = None
+        # F5/F9 save states; snapshots hold a fixed brick grid, so not in
+        # endless games, and a replay has to follow its recorded inputs
+        self.save_states = self.playback is None and not self.state.bricks.endless
+        self.autopilot = None
+        self.started = None
+        self.events = []
+        self.accumulator = 0.0
+        self.alpha = 1.0
+        self.pending_launch = 0
+
+    def enter(self, manager):
+        super().enter(manager)
+        self.profiler = self.state.profiler = manager.profiler
+        if self.playback is None and manager.record_path:
+            self.recording = manager.recording = Replay(self.state.level_name, self.state.rng_seed)
+        self.started = time.perf_counter()
+        if self.playback is None and manager.autopilot:
+            self.autopilot = Autopilot()
+        # Snapshots hold a fixed brick grid, so an endless game can't rewind
+        if self.playback is None and manager.rewind_seconds > 0 and not self.state.bricks.endless:
+            self.rewind = RewindBuffer(max(1, round(manager.rewind_seconds * SIM_HZ)))
+            self.rewind.capture(self.state)
+        manager.renderer.reset(self.state)
+
+    def quick_save(self):
+        try:
+            Snapshot.capture(self.state).save(QUICKSAVE_PATH)
+        except OSError as error:
+            print(f"quick save failed: {error}", file=sys.stderr)
+
+    def quick_load(self):
+        try:
+            snapshot = Snapshot.load(QUICKSAVE_PATH)
+        except (OSError, ValueError) as error:
+            print(f"quick load failed: {error}", file=sys.stderr)
+            return
+        state = self.state
+        bricks = state.bricks
+        snapshot.restore(state)
+        # The game no longer follows the recorded inputs
+        if self.recording is not None:
+            self.manager.save_recording()
+            self.recording = None
+        if self.rewind is not None:
+            self.rewind.clear()
+            self.rewind.capture(state)
+        if state.bricks is not bricks:
+            self.manager.renderer.reset(state)
+
+    def handle_event(self, event):
+        if event.type == pygame.KEYDOWN and event.key == pygame.K_F3 and self.manager.overlay:
+            self.manager.overlay.visible = not self.manager.overlay.visible
+        elif event.type == pygame.KEYDOWN and self.save_states:
+            if event.key == pygame.K_F5:
+                self.quick_save()
+            elif event.key == pygame.K_F9:
+                self.quick_load()
+        self.events.append(event)
+
+    def update(self, dt):
+        state = self.state
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.begin_frame(state.collision_tests)
+        inputs = read_inputs(self.events)
+        self.events.clear()
+        if profiler is not None:
+            profiler.mark('input')
+        # A click has to survive frames that run no simulation step
+        self.pending_launch |= inputs & INPUT_LAUNCH
+
+        rewinding = self.rewind is not None and pygame.key.get_pressed()[pygame.K_BACKSPACE]
+
+        self.accumulator += min(dt, MAX_FRAME_TIME) * self.manager.speed
+        while self.accumulator >= SIM_DT and not state.finished:
+            if rewinding:
+                self.rewind.rewind(1).restore(state)
+                if self.recording is not None:
+                    self.recording.truncate(state.frame)
+                self.pending_launch = 0
+                self.accumulator -= SIM_DT
+                continue
+            if self.playback is not None:
+                step_inputs = next(self.replay_inputs, None)
+                if step_inputs is None:
+                    # Recording ended before the game did
+                    self.switch_to(StartScene())
+                    return
+            else:
+                step_inputs = inputs | self.pending_launch
+                self.pending_launch = 0
+                if self.autopilot is not None:
+                    step_inputs = self.autopilot(state)
+                if self.recording is not None:
+                    self.recording.record(step_inputs)
+            state.step(step_inputs)
+            if self.rewind is not None:
+                self.rewind.capture(state)
+            self.accumulator -= SIM_DT
+        self.alpha = self.accumulator / SIM_DT
+
+        if state.finished and self.recording is not None:
+            self.manager.save_recording()
+        session = None
+        # Only games a player played go in the score store, not replays or
+        # autopilot demos
+        if (state.finished and self.playback is None and self.autopilot is None
+                and self.manager.scores is not None):
+            session = self.session()
+            self.manager.scores.record(session)
+        if state.game_over:
+            self.switch_to(GameOverScene(state.score, session))
+        elif state.won:
+            self.switch_to(WinScene(state.score, session))
+
+    def session(self):
+        # Score store row for the finished game
+        state = self.state
+        return {
+            'level': state.level_name,
+            'score': state.score,
+            'won': state.won,
+            'frames': state.frame,
+            'duration': time.perf_counter() - self.started,
+            'power_ups': state.power_ups_collected,
+            'max_balls': state.max_balls,
+            'seed': state.rng_seed,
+            'finished_at': time.time(),
+        }
+
+    def draw(self, surface):
+        self.manager.renderer.draw(self.state, self.alpha)
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.mark('draw')
+            profiler.end_frame(self.state.collision_tests)
+
+class SceneManager:
+    # Runs one scene at a time and hands off when a scene sets next_scene.
+    # Menus block on the event queue instead of spinning, so an idle menu
+    # costs next to no CPU.
+    def __init__(self, surface, renderer, clock, fps=60, profiler=None,
+                 record_path=None, speed=1.0, app=None, rewind_seconds=REWIND_SECONDS,
+                 scores=None, autopilot=False):
+        # fps caps the render rate only; 0 renders as fast as possible.
+        # speed scales simulated time, e.g. to fast-forward a replay.
+        # app, if given, is told when frames are shown.
+        # rewind_seconds of history are kept per game; 0 turns rewind off.
+        # scores, a scores.ScoreStore, records finished games.
+        # With autopilot the paddle plays itself (demos, attract mode).
+        self.app = app
+        self.autopilot = autopilot
+        self.rewind_seconds = rewind_seconds
+        self.scores = scores
+        self.surface = surface
+        self.renderer = renderer
+        self.clock = clock
+        self.fps = fps
+        self.speed = speed
+        self.profiler = profiler
+        self.record_path = record_path
+        self.recording = None
+        self.overlay = None
+        if profiler is not None:
+            self.overlay = ProfilerOverlay(profiler)
+            renderer.overlays.append(self.overlay)
+
+    def save_recording(self):
+        if self.recording is not None:
+            self.recording.save(self.record_path)
+            self.recording = None
+
+    def frame_shown(self):
+        if self.app is not None:
+            self.app.frame_shown()
+
+    def dispatch(self, scene, event):
+        if event.type == pygame.QUIT:
+            pygame.quit()
+            sys.exit()
+        if event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+            scene.dirty = True
+        scene.handle_event(event)
+
+    def run(self, scene):
+        scene.enter(self)
+        while scene is not None:
+            if scene.animated:
+                dt = self.clock.tick(self.fps) / 1000.0
+                for event in pygame.event.get():
+                    self.dispatch(scene, event)
+                scene.update(dt)
+                if scene.next_scene is None:
+                    scene.draw(self.surface)
+                    self.frame_shown()
+            else:
+                if scene.dirty:
+                    scene.draw(self.surface)
+                    pygame.display.flip()
+                    self.frame_shown()
+                    scene.dirty = False
+                event = pygame.event.wait(MENU_WAIT_MS)
+                if event.type != pygame.NOEVENT:
+                    self.dispatch(scene, event)
+            if scene.next_scene is not None:
+                scene = scene.next_scene
+                scene.enter(self)
+                # Don't bill the time spent in the previous scene to this one
+                self.clock.tick()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Brick Breaker")
+    parser.add_argument('--renderer', choices=sorted(RENDERERS), default='dirty',
+                        help="dirty-rect updates over a baked brick layer, "
+                             "or a full redraw every frame")
+    parser.add_argument('--fps', type=int, default=60,
+                        help="render rate cap (0 = uncapped); physics always "
+                             f"runs at {SIM_HZ} Hz")
+    parser.add_argument('--profile', action='store_true',
+                        help="time each frame phase; F3 toggles the overlay")
+    parser.add_argument('--profile-out', metavar='PATH',
+                        help="write profiler stats at exit (.json summary or "
+                             ".csv per-frame rows); implies --profile")
+    parser.add_argument('--record', metavar='PATH',
+                        help="save each game's seed and inputs as a replay")
+    parser.add_argument('--replay', metavar='PATH', help="play back a recorded replay")
+    parser.add_argument('--headless', action='store_true',
+                        help="with --replay: simulate at full speed without a window")
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help="simulation speed multiplier for on-screen play")
+    parser.add_argument('--levels', nargs='+', default=[], metavar='PACK',
+                        help="extra compiled level packs (see levelpack.py)")
+    parser.add_argument('--rewind', type=float, default=REWIND_SECONDS, metavar='SECONDS',
+                        help="history kept for rewinding with Backspace (0 = off)")
+    parser.add_argument('--scores', default=scores.DEFAULT_PATH, metavar='PATH',
+                        help="SQLite database for high scores and game stats")
+    parser.add_argument('--no-scores', action='store_true', help="don't store finished games")
+    parser.add_argument('--autopilot', action='store_true',
+                        help="let the computer play (the paddle ignores the keyboard)")
+    parser.add_argument('--startup-report', action='store_true',
+                        help="print how long each startup phase took, up to the first frame")
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args()
+    for path in args.levels:
+        try:
+            load_level_pack(path)
+        except (levelpack.LevelError, OSError) as error:
+            sys.exit(f"--levels: {error}")
+    profiler = None
+    if args.profile or args.profile_out:
+        profiler = FrameProfiler(keep_history=bool(args.profile_out
+                                                   and args.profile_out.endswith('.csv')))
+    replay = None
+    if args.replay:
+        try:
+            replay = Replay.load(args.replay)
+            if replay.level_name != ENDLESS_LEVEL and replay.level_name not in LEVELS:
+                raise ValueError(f"unknown level {replay.level_name!r} (load its pack with --levels)")
+        except (OSError, ValueError, KeyError) as error:
+            sys.exit(f"--replay: {error}")
+
+    if args.headless:
+        if replay is None:
+            sys.exit("--headless needs --replay")
+        start = time.perf_counter()
+        state = run_replay(replay, profiler)
+        elapsed = time.perf_counter() - start
+        print(f"{replay.level_name}: {state.frame} frames in {elapsed:.3f}s "
+              f"({state.frame / max(elapsed, 1e-9):.0f} frames/s), score {state.score}, "
+              f"lives {state.lives}, {'won' if state.won else 'lost' if state.game_over else 'unfinished'}")
+        if profiler is not None and args.profile_out:
+            profiler.dump(args.profile_out)
+        return
+
+    store = None
+    if not args.no_scores:
+        try:
+            store = scores.ScoreStore(args.scores)
+        except sqlite3.Error as error:
+            print(f"--scores: {error}; not storing scores", file=sys.stderr)
+
+    app = App(startup_report=args.startup_report)
+    screen = app.start()
+    renderer = RENDERERS[args.renderer](screen)
+    manager = SceneManager(screen, renderer, app.clock, args.fps, profiler,
+                           record_path=args.record, speed=args.speed, app=app,
+                           rewind_seconds=args.rewind, scores=store,
+                           autopilot=args.autopilot)
+    first_scene = GameScene(None, replay) if replay is not None else StartScene()
+    try:
+        manager.run(first_scene)
+    finally:
+        # Keep a partial recording if the window is closed mid-game
+        manager.save_recording()
+        if store is not None:
+            store.close()
+        if profiler is not None and args.profile_out:
+            profiler.dump(args.profile_out)
+
+
+# End of the import phase in App.report()
+IMPORT_FINISHED = time.perf_counter()
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
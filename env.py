@@ -0,0 +1,239 @@
+import multiprocessing
+import time
+
+import numpy as np
+
+import brick_breaker as bb
+
+# Discrete actions an agent picks from, as GameState input bits
+ACTIONS = (
+    0,
+    bb.INPUT_LEFT,
+    bb.INPUT_RIGHT,
+    bb.INPUT_LAUNCH,
+    bb.INPUT_LAUNCH | bb.INPUT_LEFT,
+    bb.INPUT_LAUNCH | bb.INPUT_RIGHT,
+)
+
+# Values per ball slot in the state vector: x, y, dx, dy, in play
+BALL_FEATURES = 5
+
+
+class BrickBreakerEnv:
+    # Gym-style wrapper around GameState:
+    #   obs, info = env.reset(seed)
+    #   obs, reward, terminated, truncated, info = env.step(action)
+    # Each step repeats the action for `frame_skip` simulation frames. The
+    # reward is the score gained minus `life_penalty` per life lost.
+    #
+    # observation='state' gives a float32 vector: paddle x and width, then
+    # `max_balls` ball slots (unused slots are zero), then hits left for every
+    # cell of the brick grid, all scaled to roughly 0..1.
+    # observation='pixels' gives the rendered frame as (height, width, 3) uint8,
+    # scaled to pixel_size=(width, height) if given, and (height, width) with
+    # grayscale.
+    def __init__(self, level_name='Classic', observation='state', frame_skip=4,
+                 max_frames=20000, max_balls=8, life_penalty=100, seed=None,
+                 pixel_size=None, grayscale=False):
+        if observation not in ('state', 'pixels'):
+            raise ValueError(f"unknown observation type {observation!r}")
+        self.level_name = level_name
+        self.observation = observation
+        self.frame_skip = frame_skip
+        self.max_frames = max_frames
+        self.max_balls = max_balls
+        self.life_penalty = life_penalty
+        self.n_actions = len(ACTIONS)
+        self.seed_rng = np.random.default_rng(seed)
+        self.template = bb.LEVELS[level_name]['pattern']()
+        self.state = None
+        if observation == 'state':
+            self.observation_shape = (2 + max_balls * BALL_FEATURES + len(self.template.hits),)
+            self.observation_dtype = np.float32
+            self.obs = np.zeros(self.observation_shape, np.float32)
+            self.ball_obs = self.obs[2:2 + max_balls * BALL_FEATURES].reshape(max_balls, BALL_FEATURES)
+            self.brick_obs = self.obs[2 + max_balls * BALL_FEATURES:]
+        else:
+            self.renderer = bb.OffscreenRenderer(pixel_size, grayscale)
+            width, height = pixel_size or (bb.WINDOW_WIDTH, bb.WINDOW_HEIGHT)
+            self.observation_shape = (height, width) if grayscale else (height, width, 3)
+            self.observation_dtype = np.uint8
+
+    def reset(self, seed=None):
+        if seed is None:
+            seed = int(self.seed_rng.integers(2 ** 63))
+        self.state = bb.GameState(self.level_name, seed=seed, bricks=self.template.copy())
+        if self.observation == 'state':
+            # Zero-copy view of the hits bytearray; only the scaling copies
+            self.brick_hits = np.frombuffer(self.state.bricks.hits, dtype=np.uint8)
+        else:
+            self.renderer.reset(self.state)
+        return self.observe(), {'seed': seed}
+
+    def step(self, action):
+        state = self.state
+        inputs = ACTIONS[action]
+        score, lives = state.score, state.lives
+        for _ in range(self.frame_skip):
+            state.step(inputs)
+            if state.finished:
+                break
+        reward = state.score - score
+        if state.lives < lives:
+            reward -= self.life_penalty * (lives - state.lives)
+        terminated = state.finished
+        truncated = not terminated and state.frame >= self.max_frames
+        info = {'score': state.score, 'lives': state.lives, 'frame': state.frame,
+                'won': state.won}
+        return self.observe(), float(reward), terminated, truncated, info
+
+    def observe(self):
+        state = self.state
+        if self.observation == 'pixels':
+            # The renderer reuses its buffers (and a full-size frame locks its
+            # surface), so hand out a copy
+            self.renderer.draw(state)
+            return self.renderer.observation().copy()
+        obs = self.obs
+        paddle = state.paddle
+        obs[0] = paddle.x / bb.WINDOW_WIDTH
+        obs[1] = paddle.width / bb.WINDOW_WIDTH
+        balls = self.ball_obs
+        balls.fill(0)
+        for slot, ball in zip(range(self.max_balls), state.balls):
+            balls[slot] = (ball.x / bb.WINDOW_WIDTH, ball.y / bb.WINDOW_HEIGHT,
+                           ball.dx / bb.BALL_SPEED, ball.dy / bb.BALL_SPEED, ball.in_play)
+        np.multiply(self.brick_hits, 1 / 3, out=self.brick_obs)
+        return obs.copy()
+
+    def close(self):
+        pass
+
+
+class SyncVectorEnv:
+    # Steps several envs one after another in this process and returns
+    # stacked arrays. An env that finishes is reset straight away; its final
+    # observation is passed in info['final_observation'].
+    def __init__(self, env_fns):
+        self.envs = [fn() for fn in env_fns]
+        self.num_envs = len(self.envs)
+        first = self.envs[0]
+        self.n_actions = first.n_actions
+        self.observation_shape = first.observation_shape
+        self.obs = np.zeros((self.num_envs,) + first.observation_shape, first.observation_dtype)
+
+    def reset(self, seed=None):
+        infos = []
+        for i, env in enumerate(self.envs):
+            self.obs[i], info = env.reset(None if seed is None else seed + i)
+            infos.append(info)
+        return self.obs.copy(), infos
+
+    def step(self, actions):
+        rewards = np.zeros(self.num_envs, np.float32)
+        terminated = np.zeros(self.num_envs, bool)
+        truncated = np.zeros(self.num_envs, bool)
+        infos = []
+        for i, env in enumerate(self.envs):
+            obs, rewards[i], terminated[i], truncated[i], info = env.step(actions[i])
+            if terminated[i] or truncated[i]:
+                info['final_observation'] = obs
+                obs, _ = env.reset()
+            self.obs[i] = obs
+            infos.append(info)
+        return self.obs.copy(), rewards, terminated, truncated, infos
+
+    def close(self):
+        for env in self.envs:
+            env.close()
+
+
+def _worker(pipe, env_fns, obs_buffer, first, shape, dtype):
+    # Runs a SyncVectorEnv over some of the envs and writes observations
+    # straight into the parent's shared buffer; only rewards, flags and info
+    # go back over the pipe
+    envs = SyncVectorEnv(env_fns)
+    obs = np.frombuffer(obs_buffer, dtype=dtype).reshape((-1,) + shape)[first:first + envs.num_envs]
+    while True:
+        command, data = pipe.recv()
+        if command == 'step':
+            obs[:], rewards, terminated, truncated, infos = envs.step(data)
+            pipe.send((rewards, terminated, truncated, infos))
+        elif command == 'reset':
+            obs[:], infos = envs.reset(data)
+            pipe.send(infos)
+        elif command == 'close':
+            envs.close()
+            pipe.close()
+            return
+
+
+class SubprocVectorEnv:
+    # Same interface as SyncVectorEnv, with the envs split across worker
+    # processes. Observations are exchanged through shared memory instead of
+    # being pickled. env_fns must be picklable when the start method is not
+    # fork (e.g. functools.partial(BrickBreakerEnv, ...)).
+    def __init__(self, env_fns, workers=None):
+        self.num_envs = len(env_fns)
+        workers = min(workers or multiprocessing.cpu_count(), self.num_envs)
+        probe = env_fns[0]()
+        self.n_actions = probe.n_actions
+        self.observation_shape = probe.observation_shape
+        dtype = np.dtype(probe.observation_dtype)
+        probe.close()
+        size = self.num_envs * int(np.prod(self.observation_shape)) * dtype.itemsize
+        self.obs_buffer = multiprocessing.RawArray('B', size)
+        self.obs = np.frombuffer(self.obs_buffer, dtype=dtype).reshape(
+            (self.num_envs,) + self.observation_shape)
+        self.pipes = []
+        self.processes = []
+        self.slices = []
+        bounds = [self.num_envs * i // workers for i in range(workers + 1)]
+        for first, last in zip(bounds[:-1], bounds[1:]):
+            parent, child = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=_worker, daemon=True,
+                args=(child, env_fns[first:last], self.obs_buffer, first,
+                      self.observation_shape, dtype))
+            process.start()
+            child.close()
+            self.pipes.append(parent)
+            self.processes.append(process)
+            self.slices.append((first, last))
+
+    def reset(self, seed=None):
+        for pipe, (first, _) in zip(self.pipes, self.slices):
+            pipe.send(('reset', None if seed is None else seed + first))
+        infos = [info for pipe in self.pipes for info in pipe.recv()]
+        return self.obs.copy(), infos
+
+    def step(self, actions):
+        for pipe, (first, last) in zip(self.pipes, self.slices):
+            pipe.send(('step', actions[first:last]))
+        results = [pipe.recv() for pipe in self.pipes]
+        rewards = np.concatenate([r[0] for r in results])
+        terminated = np.concatenate([r[1] for r in results])
+        truncated = np.concatenate([r[2] for r in results])
+        infos = [info for r in results for info in r[3]]
+        return self.obs.copy(), rewards, terminated, truncated, infos
+
+    def close(self):
+        for pipe in self.pipes:
+            pipe.send(('close', None))
+        for process in self.processes:
+            process.join()
+
+
+if __name__ == "__main__":
+    # Throughput check: random actions on 8 in-process state-vector envs
+    from functools import partial
+    envs = SyncVectorEnv([partial(BrickBreakerEnv, frame_skip=4)] * 8)
+    envs.reset(seed=0)
+    rng = np.random.default_rng(0)
+    steps = 2000
+    start = time.perf_counter()
+    for _ in range(steps):
+        envs.step(rng.integers(envs.n_actions, size=envs.num_envs))
+    elapsed = time.perf_counter() - start
+    print(f"{steps * envs.num_envs / elapsed:.0f} env steps/s, "
+          f"{steps * envs.num_envs * 4 / elapsed:.0f} frames/s")
@@ -0,0 +1,298 @@
+import argparse
+import mmap
+import os
+import struct
+import sys
+
+# Authoring format: a text file holding one or more levels.
+#
+#   # comment
+#   [Diamond]
+#   description: Diamond shaped pattern
+#   x: 113            (optional; bricks are centred by default)
+#   y: 50             (optional)
+#   ...n...
+#   ..ntn..
+#
+# Every grid line is one row of bricks; short rows are padded with empty
+# cells. Cell characters map to the brick types below.
+CELL_TYPES = {'.': None, 'n': 'normal', 't': 'tough', 's': 'super'}
+TYPE_CHARS = {name: char for char, name in CELL_TYPES.items()}
+
+MAX_ROWS = 1024
+MAX_COLS = 1024
+
+# Binary pack: a header, the brick type names, a fixed-size index entry per
+# level, then the strings and cell grids the index points at. Cells are one
+# byte each: 0 for empty, otherwise 1 + the position in the type table. The
+# pack is memory-mapped and only the entries asked for are decoded.
+MAGIC = b'BBPK'
+VERSION = 1
+HEADER = struct.Struct('<4sHHI')           # magic, version, type count, level count
+ENTRY = struct.Struct('<IHIHIHHhh')        # name, description, cells, rows, cols, x, y
+CENTERED = -32768                          # x sentinel: centre the columns at load time
+
+
+class LevelError(ValueError):
+    pass
+
+
+class Level:
+    def __init__(self, name, description='', rows=0, cols=0, x=None, y=50, cells=b''):
+        self.name = name
+        self.description = description
+        self.rows = rows
+        self.cols = cols
+        self.x = x
+        self.y = y
+        # Row-major brick type names, None for empty cells
+        self.cells = cells
+
+    def __repr__(self):
+        return f"Level({self.name!r}, {self.rows}x{self.cols})"
+
+
+def parse_levels(text, filename='<string>'):
+    levels = []
+    level = None
+    grid = []
+
+    def finish():
+        if level is None:
+            return
+        if not grid:
+            raise LevelError(f"{filename}: level {level.name!r} has no rows")
+        level.rows = len(grid)
+        level.cols = max(len(row) for row in grid)
+        cells = []
+        for row in grid:
+            cells.extend(row + [None] * (level.cols - len(row)))
+        level.cells = cells
+        levels.append(level)
+
+    for lineno, raw in enumerate(text.splitlines(), 1):
+        line = raw.strip()
+        if not line or line.startswith('#'):
+            continue
+        where = f"{filename}:{lineno}"
+        if line.startswith('[') and line.endswith(']'):
+            finish()
+            name = line[1:-1].strip()
+            if not name:
+                raise LevelError(f"{where}: empty level name")
+            level = Level(name)
+            grid = []
+        elif level is None:
+            raise LevelError(f"{where}: expected a [level name] header")
+        elif ':' in line and not grid:
+            key, value = (part.strip() for part in line.split(':', 1))
+            if key == 'description':
+                level.description = value
+            elif key in ('x', 'y'):
+                try:
+                    setattr(level, key, int(value))
+                except ValueError:
+                    raise LevelError(f"{where}: {key} must be an integer") from None
+            else:
+                raise LevelError(f"{where}: unknown key {key!r}")
+        else:
+            row = []
+            for col, char in enumerate(line, 1):
+                if char not in CELL_TYPES:
+                    raise LevelError(f"{where}:{col}: unknown cell {char!r}")
+                row.append(CELL_TYPES[char])
+            grid.append(row)
+    finish()
+    return levels
+
+
+def validate(levels):
+    # Raises LevelError for anything the pack format or the game can't load
+    seen = set()
+    for level in levels:
+        if level.name in seen:
+            raise LevelError(f"duplicate level name {level.name!r}")
+        seen.add(level.name)
+        if len(level.name.encode('utf-8')) > 0xffff or len(level.description.encode('utf-8')) > 0xffff:
+            raise LevelError(f"{level.name}: name or description too long")
+        if not 0 < level.rows <= MAX_ROWS or not 0 < level.cols <= MAX_COLS:
+            raise LevelError(f"{level.name}: grid must be between 1x1 and {MAX_ROWS}x{MAX_COLS}")
+        if not any(level.cells):
+            raise LevelError(f"{level.name}: level has no bricks")
+        for value in (level.x, level.y):
+            if value is not None and not -32767 <= value <= 32767:
+                raise LevelError(f"{level.name}: position out of range")
+
+
+def read_sources(paths):
+    levels = []
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            levels.extend(parse_levels(f.read(), path))
+    validate(levels)
+    return levels
+
+
+def compile_pack(levels, path):
+    validate(levels)
+    type_names = [name for name in CELL_TYPES.values() if name]
+    codes = {name: i + 1 for i, name in enumerate(type_names)}
+    codes[None] = 0
+
+    head = bytearray(HEADER.pack(MAGIC, VERSION, len(type_names), len(levels)))
+    for name in type_names:
+        encoded = name.encode('utf-8')
+        head.append(len(encoded))
+        head += encoded
+
+    blob = bytearray()
+    blob_start = len(head) + ENTRY.size * len(levels)
+    entries = bytearray()
+    for level in levels:
+        name = level.name.encode('utf-8')
+        description = level.description.encode('utf-8')
+        name_offset = blob_start + len(blob)
+        blob += name
+        description_offset = blob_start + len(blob)
+        blob += description
+        cells_offset = blob_start + len(blob)
+        blob += bytes(codes[cell] for cell in level.cells)
+        x = CENTERED if level.x is None else level.x
+        entries += ENTRY.pack(name_offset, len(name), description_offset, len(description),
+                              cells_offset, level.rows, level.cols, x, level.y)
+
+    with open(path, 'wb') as f:
+        f.write(head + entries + blob)
+
+
+class LevelPack:
+    # Read-only view of a compiled pack. Opening it maps the file and reads
+    # the header; names, descriptions and cell grids are decoded on demand.
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size < HEADER.size:
+                raise LevelError(f"{path}: truncated level pack")
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._read_index()
+        except LevelError:
+            self.data.close()
+            raise
+
+    def _check(self, end, what):
+        if end > len(self.data):
+            raise LevelError(f"{self.path}: truncated level pack ({what})")
+
+    def _read_index(self):
+        magic, version, type_count, self.count = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            raise LevelError(f"{self.path}: not a level pack")
+        if version != VERSION:
+            raise LevelError(f"{self.path}: unsupported pack version {version}")
+        offset = HEADER.size
+        self.type_names = [None]
+        for _ in range(type_count):
+            self._check(offset + 1, "type table")
+            length = self.data[offset]
+            self._check(offset + 1 + length, "type table")
+            self.type_names.append(self.data[offset + 1:offset + 1 + length].decode('utf-8'))
+            offset += 1 + length
+        self.index_offset = offset
+        self._check(offset + self.count * ENTRY.size, "index")
+        # Every string and grid the index points at must lie inside the file,
+        # so the lazy accessors never read past the end
+        for i in range(self.count):
+            name, name_length, description, description_length, cells, rows, cols = \
+                ENTRY.unpack_from(self.data, offset + i * ENTRY.size)[:7]
+            self._check(name + name_length, f"level {i} name")
+            self._check(description + description_length, f"level {i} description")
+            self._check(cells + rows * cols, f"level {i} cells")
+
+    def __len__(self):
+        return self.count
+
+    def entry(self, i):
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        return ENTRY.unpack_from(self.data, self.index_offset + i * ENTRY.size)
+
+    def name(self, i):
+        offset, length = self.entry(i)[:2]
+        return self.data[offset:offset + length].decode('utf-8')
+
+    def description(self, i):
+        offset, length = self.entry(i)[2:4]
+        return self.data[offset:offset + length].decode('utf-8')
+
+    def names(self):
+        return [self.name(i) for i in range(self.count)]
+
+    def cells(self, i):
+        # (rows, cols, x or None when centred, y, cell codes as a memoryview)
+        _, _, _, _, offset, rows, cols, x, y = self.entry(i)
+        cells = memoryview(self.data)[offset:offset + rows * cols]
+        return rows, cols, (None if x == CENTERED else x), y, cells
+
+    def level(self, i):
+        rows, cols, x, y, cells = self.cells(i)
+        return Level(self.name(i), self.description(i), rows, cols, x, y,
+                     [self.type_names[code] for code in cells])
+
+    def close(self):
+        self.data.close()
+
+
+def format_level(level):
+    lines = [f"[{level.name}]"]
+    if level.description:
+        lines.append(f"description: {level.description}")
+    if level.x is not None:
+        lines.append(f"x: {level.x}")
+    if level.y != 50:
+        lines.append(f"y: {level.y}")
+    for row in range(level.rows):
+        cells = level.cells[row * level.cols:(row + 1) * level.cols]
+        lines.append(''.join(TYPE_CHARS[cell] for cell in cells).rstrip('.') or '.')
+    return '\n'.join(lines) + '\n'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Validate, compile and inspect level packs")
+    commands = parser.add_subparsers(dest='command', required=True)
+    check = commands.add_parser('validate', help="check level sources for errors")
+    check.add_argument('sources', nargs='+')
+    build = commands.add_parser('compile', help="compile level sources into a pack")
+    build.add_argument('sources', nargs='+')
+    build.add_argument('-o', '--output', required=True)
+    show = commands.add_parser('list', help="list the levels in a compiled pack")
+    show.add_argument('pack')
+    unpack = commands.add_parser('decompile', help="write a pack back out as level source")
+    unpack.add_argument('pack')
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == 'validate':
+            levels = read_sources(args.sources)
+            print(f"{len(levels)} levels OK")
+        elif args.command == 'compile':
+            levels = read_sources(args.sources)
+            compile_pack(levels, args.output)
+            print(f"wrote {len(levels)} levels to {args.output} "
+                  f"({os.path.getsize(args.output)} bytes)")
+        elif args.command == 'list':
+            pack = LevelPack(args.pack)
+            for i in range(len(pack)):
+                rows, cols = pack.entry(i)[5:7]
+                print(f"{pack.name(i):24s} {rows:4d}x{cols:<4d} {pack.description(i)}")
+        elif args.command == 'decompile':
+            pack = LevelPack(args.pack)
+            print('\n'.join(format_level(pack.level(i)) for i in range(len(pack))), end='')
+    except (LevelError, OSError) as error:
+        print(f"error: {error}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
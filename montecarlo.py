@@ -0,0 +1,258 @@
+import argparse
+import csv
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import brick_breaker as bb
+from benchmark import CONTROLLERS
+
+# Game settings a sweep may change. POWERUP_CHANCES entries are addressed as
+# POWERUP_CHANCES.<type>. POWERUP_CHANCE is not here: the game spawns
+# power-ups with the sum of POWERUP_CHANCES and never reads it.
+DEFAULTS = {
+    'BALL_SPEED': bb.BALL_SPEED,
+    'INITIAL_LIVES': bb.INITIAL_LIVES,
+    'POWERUP_CHANCES': dict(bb.POWERUP_CHANCES),
+}
+
+# Lower bounds of the ball-count buckets reported as a share of frames
+BALL_BUCKETS = (1, 2, 3, 5, 9)
+
+DEFAULT_MAX_FRAMES = 20000
+DEFAULT_CHUNK = 50
+DEFAULT_CONTROLLER = 'scripted'
+
+
+def apply_config(config):
+    # Resets the tunable module globals to their defaults, then applies
+    # `config`. Workers are reused across configs, so nothing may leak.
+    bb.BALL_SPEED = DEFAULTS['BALL_SPEED']
+    bb.INITIAL_LIVES = DEFAULTS['INITIAL_LIVES']
+    chances = dict(DEFAULTS['POWERUP_CHANCES'])
+    for key, value in config.items():
+        name, _, power_up = key.partition('.')
+        if name == 'POWERUP_CHANCES' and power_up in chances:
+            chances[power_up] = float(value)
+        elif name == 'POWERUP_CHANCES' and not power_up and set(value) <= set(chances):
+            chances.update({key: float(chance) for key, chance in value.items()})
+        elif name == 'BALL_SPEED' and not power_up:
+            bb.BALL_SPEED = float(value)
+        elif name == 'INITIAL_LIVES' and not power_up:
+            bb.INITIAL_LIVES = int(value)
+        else:
+            raise ValueError(f"unknown setting {key!r}")
+    bb.POWERUP_CHANCES.clear()
+    bb.POWERUP_CHANCES.update(chances)
+    bb.build_power_up_table()
+
+
+def expand_grid(grid):
+    # A grid is either a list of configs or a mapping of setting -> list of
+    # values, expanded to every combination
+    if isinstance(grid, list):
+        return [dict(config) for config in grid]
+    keys = list(grid)
+    values = [grid[key] if isinstance(grid[key], list) else [grid[key]] for key in keys]
+    return [dict(zip(keys, combo)) for combo in itertools.product(*values)]
+
+
+def parse_setting(text):
+    # NAME=v1,v2,... from the command line
+    key, sep, values = text.partition('=')
+    if not sep or not values:
+        raise argparse.ArgumentTypeError(f"expected NAME=VALUE[,VALUE...], got {text!r}")
+    return key.strip(), [json.loads(value) for value in values.split(',')]
+
+
+def new_stats():
+    return {
+        'games': 0,
+        'wins': 0,
+        'losses': 0,
+        'timeouts': 0,
+        'score_sum': 0,
+        'clear_frames_sum': 0,
+        'frames': 0,
+        'max_balls': 0,
+        'ball_frames': [0] * len(BALL_BUCKETS),
+    }
+
+
+def merge_stats(total, part):
+    for key, value in part.items():
+        if key == 'max_balls':
+            total[key] = max(total[key], value)
+        elif key == 'ball_frames':
+            total[key] = [a + b for a, b in zip(total[key], value)]
+        else:
+            total[key] += value
+
+
+def play(level_name, seed, max_frames, stats, controller):
+    state = bb.GameState(level_name, seed=seed)
+    ball_frames = stats['ball_frames']
+    buckets = len(BALL_BUCKETS)
+    while not state.finished and state.frame < max_frames:
+        state.step(controller(state))
+        count = len(state.balls)
+        bucket = buckets - 1
+        while bucket > 0 and count < BALL_BUCKETS[bucket]:
+            bucket -= 1
+        ball_frames[bucket] += 1
+        if count > stats['max_balls']:
+            stats['max_balls'] = count
+    stats['games'] += 1
+    stats['frames'] += state.frame
+    stats['score_sum'] += state.score
+    if state.won:
+        stats['wins'] += 1
+        stats['clear_frames_sum'] += state.frame
+    elif state.game_over:
+        stats['losses'] += 1
+    else:
+        stats['timeouts'] += 1
+
+
+def run_chunk(task):
+    # Worker entry point: plays seeds first_seed..last_seed-1 of one config
+    config_index, config, level_name, first_seed, last_seed, max_frames, controller = task
+    apply_config(config)
+    stats = new_stats()
+    controller = CONTROLLERS[controller]()
+    for seed in range(first_seed, last_seed):
+        play(level_name, seed, max_frames, stats, controller)
+    return config_index, stats
+
+
+def result_row(config, level_name, stats):
+    games = stats['games']
+    wins = stats['wins']
+    frames = max(1, stats['frames'])
+    row = {'level': level_name}
+    row.update({key: json.dumps(value) if isinstance(value, dict) else value
+                for key, value in config.items()})
+    row.update({
+        'games': games,
+        'win_rate': wins / games,
+        'loss_rate': stats['losses'] / games,
+        'timeout_rate': stats['timeouts'] / games,
+        'avg_score': stats['score_sum'] / games,
+        'avg_frames_to_clear': stats['clear_frames_sum'] / wins if wins else '',
+        'max_balls': stats['max_balls'],
+    })
+    for i, low in enumerate(BALL_BUCKETS):
+        high = BALL_BUCKETS[i + 1] - 1 if i + 1 < len(BALL_BUCKETS) else None
+        name = f"balls_{low}" if high == low else f"balls_{low}_{high}" if high else f"balls_{low}_plus"
+        row[name] = stats['ball_frames'][i] / frames
+    return row
+
+
+class ResultWriter:
+    # Appends one row per finished config: CSV, or JSON lines for a path
+    # ending in .jsonl. Rows are flushed as they come so a long sweep can be
+    # watched (or loaded into a dataframe) while it runs.
+    def __init__(self, path):
+        self.file = open(path, 'w', newline='') if path != '-' else sys.stdout
+        self.json_lines = path.endswith('.jsonl')
+        self.writer = None
+
+    def write(self, row):
+        if self.json_lines:
+            self.file.write(json.dumps(row) + '\n')
+        else:
+            if self.writer is None:
+                self.writer = csv.DictWriter(self.file, fieldnames=list(row), restval='')
+                self.writer.writeheader()
+            self.writer.writerow(row)
+        self.file.flush()
+
+    def close(self):
+        if self.file is not sys.stdout:
+            self.file.close()
+
+
+def sweep(configs, level_names, games, out, seed=0, max_frames=DEFAULT_MAX_FRAMES,
+          workers=None, chunk=DEFAULT_CHUNK, controller=DEFAULT_CONTROLLER):
+    # Every (config, level) pair plays `games` seeded games split into chunks
+    # of `chunk` games, which are spread over a process pool. A pair's row is
+    # written as soon as its last chunk comes back.
+    jobs = [(config, level_name) for config in configs for level_name in level_names]
+    for config, _ in jobs:
+        apply_config(config)  # fail on a bad setting before starting workers
+    apply_config({})
+    tasks = []
+    for job_index, (config, level_name) in enumerate(jobs):
+        for first in range(seed, seed + games, chunk):
+            tasks.append((job_index, config, level_name, first,
+                          min(first + chunk, seed + games), max_frames, controller))
+    pending = [-(-games // chunk)] * len(jobs)
+    totals = [new_stats() for _ in jobs]
+
+    with multiprocessing.Pool(workers) as pool:
+        for job_index, stats in pool.imap_unordered(run_chunk, tasks):
+            merge_stats(totals[job_index], stats)
+            pending[job_index] -= 1
+            if pending[job_index] == 0:
+                config, level_name = jobs[job_index]
+                out.write(result_row(config, level_name, totals[job_index]))
+    return totals
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Monte Carlo sweep of game settings with an AI paddle",
+        epilog="Settings: BALL_SPEED, INITIAL_LIVES, POWERUP_CHANCES.<type>. "
+               "Example: --set BALL_SPEED=4,5,6 --set POWERUP_CHANCES.multi_ball=0.04,0.08")
+    parser.add_argument('--grid', metavar='JSON',
+                        help="file holding a list of configs or a mapping of "
+                             "setting -> values to combine")
+    parser.add_argument('--set', dest='settings', action='append', default=[],
+                        type=parse_setting, metavar='NAME=V1,V2',
+                        help="sweep a setting over values (combined with --grid)")
+    parser.add_argument('--levels', nargs='+', default=list(bb.LEVELS), choices=list(bb.LEVELS))
+    parser.add_argument('--games', type=int, default=1000, help="seeded games per config and level")
+    parser.add_argument('--seed', type=int, default=0, help="first game seed")
+    parser.add_argument('--max-frames', type=int, default=DEFAULT_MAX_FRAMES,
+                        help="games still running after this many frames count as timeouts")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="worker processes (default: one per CPU)")
+    parser.add_argument('--chunk', type=int, default=DEFAULT_CHUNK, help="games per task")
+    parser.add_argument('--controller', choices=sorted(CONTROLLERS), default=DEFAULT_CONTROLLER,
+                        help="paddle controller playing the games")
+    parser.add_argument('-o', '--output', default='-',
+                        help="CSV file, .jsonl for JSON lines, or - for stdout")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    grid = {}
+    if args.grid:
+        with open(args.grid) as f:
+            grid = json.load(f)
+    configs = expand_grid(grid)
+    if args.settings:
+        extra = expand_grid(dict(args.settings))
+        configs = [dict(config, **more) for config in configs for more in extra]
+    out = ResultWriter(args.output)
+    start = time.perf_counter()
+    try:
+        sweep(configs, args.levels, args.games, out, args.seed, args.max_frames,
+              args.workers, args.chunk, args.controller)
+    except ValueError as error:
+        print(f"error: {error}", file=sys.stderr)
+        return 1
+    finally:
+        out.close()
+    games = len(configs) * len(args.levels) * args.games
+    print(f"{games} games in {time.perf_counter() - start:.1f}s on "
+          f"{args.workers or os.cpu_count()} workers", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,175 @@
+import argparse
+import itertools
+import queue
+import sqlite3
+import sys
+import threading
+
+# Leaderboard and per-game stats, kept in SQLite. The database runs in WAL
+# mode so the end screens can read while a commit is in progress, and the
+# game itself never waits on the disk: record() only queues a session, and a
+# background thread writes whatever has queued up in one transaction.
+DEFAULT_PATH = 'scores.db'
+
+# One row per finished game; duration is wall-clock seconds
+SESSION_FIELDS = ('level', 'score', 'won', 'frames', 'duration', 'power_ups',
+                  'max_balls', 'seed', 'finished_at')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    level TEXT NOT NULL,
+    score INTEGER NOT NULL,
+    won INTEGER NOT NULL,
+    frames INTEGER NOT NULL,
+    duration REAL NOT NULL,
+    power_ups INTEGER NOT NULL,
+    max_balls INTEGER NOT NULL,
+    seed INTEGER,
+    finished_at REAL NOT NULL
+);
+-- A level's top N is the first N entries of its range in this index, so it
+-- costs the same with a hundred stored games as with millions
+CREATE INDEX IF NOT EXISTS sessions_by_level_score ON sessions (level, score DESC);
+"""
+
+INSERT = (f"INSERT INTO sessions ({', '.join(SESSION_FIELDS)}) "
+          f"VALUES ({', '.join('?' * len(SESSION_FIELDS))})")
+TOP = (f"SELECT {', '.join(SESSION_FIELDS)} FROM sessions WHERE level = ? "
+       f"ORDER BY score DESC, id LIMIT ?")
+STATS = """
+SELECT level, COUNT(*), SUM(won), MAX(score), AVG(score), SUM(duration),
+       SUM(power_ups), MAX(max_balls)
+FROM sessions GROUP BY level ORDER BY level
+"""
+
+# Most sessions written in one transaction
+BATCH_SIZE = 512
+
+
+def connect(path):
+    db = sqlite3.connect(path)
+    db.execute('PRAGMA journal_mode=WAL')
+    # In WAL mode NORMAL only syncs at checkpoints; a crash can lose the last
+    # few games but never corrupts the database
+    db.execute('PRAGMA synchronous=NORMAL')
+    db.executescript(SCHEMA)
+    return db
+
+
+class ScoreStore:
+    # Opens (creating if needed) the database at `path` and starts the
+    # writer thread. Sessions are dicts with the SESSION_FIELDS keys. Until
+    # a session is committed it is kept in `pending`, and top() merges those
+    # in, so a game shows up on its own end screen straight away.
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self.reader = connect(path)
+        self.queue = queue.Queue()
+        self.pending = {}
+        self.keys = itertools.count()
+        # Held while committed sessions are taken out of `pending` and while
+        # top() copies it; never across a commit
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.write_loop, name='score-writer', daemon=True)
+        self.thread.start()
+
+    def record(self, session):
+        key = next(self.keys)
+        self.pending[key] = session
+        self.queue.put((key, session))
+
+    def write_loop(self):
+        db = connect(self.path)
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            items = [item for item in batch if item is not None]
+            if items:
+                try:
+                    db.executemany(INSERT, [tuple(session[field] for field in SESSION_FIELDS)
+                                            for _, session in items])
+                    db.commit()
+                    with self.lock:
+                        for key, _ in items:
+                            del self.pending[key]
+                except sqlite3.Error as error:
+                    # Keep the sessions in `pending` so this run still shows them
+                    db.rollback()
+                    print(f"score store: {error}", file=sys.stderr)
+            for _ in batch:
+                self.queue.task_done()
+            if None in batch:
+                break
+        db.close()
+
+    def top(self, level, n=10):
+        # The level's n best sessions, best first; ties go to the earlier game.
+        # `pending` is copied before the query, so a session committed in
+        # between is in both; it is dropped from the copy by matching its row.
+        with self.lock:
+            pending = [session for session in self.pending.values() if session['level'] == level]
+        rows = self.reader.execute(TOP, (level, n)).fetchall()
+        sessions = [dict(zip(SESSION_FIELDS, row)) for row in rows]
+        if pending:
+            stored = set(rows)
+            pending = [session for session in pending
+                       if tuple(session[field] for field in SESSION_FIELDS) not in stored]
+            sessions.extend(pending)
+            sessions.sort(key=lambda session: -session['score'])
+        return sessions[:n]
+
+    def stats(self):
+        # Totals per level over every committed session. This reads the whole
+        # table, so it is for tools rather than the game.
+        return [dict(zip(('level', 'games', 'wins', 'best', 'average', 'duration',
+                          'power_ups', 'max_balls'), row))
+                for row in self.reader.execute(STATS)]
+
+    def flush(self):
+        # Blocks until every recorded session is committed
+        self.queue.join()
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        self.reader.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Show stored high scores and game stats")
+    parser.add_argument('--db', default=DEFAULT_PATH, help="score database")
+    commands = parser.add_subparsers(dest='command', required=True)
+    best = commands.add_parser('top', help="best games on a level")
+    best.add_argument('level')
+    best.add_argument('-n', type=int, default=10)
+    commands.add_parser('stats', help="totals per level")
+    args = parser.parse_args(argv)
+
+    try:
+        store = ScoreStore(args.db)
+    except sqlite3.Error as error:
+        print(f"error: {error}", file=sys.stderr)
+        return 1
+    try:
+        if args.command == 'top':
+            for rank, session in enumerate(store.top(args.level, args.n), 1):
+                print(f"{rank:3d}. {session['score']:8d}  {'won ' if session['won'] else 'lost'}  "
+                      f"{session['duration']:7.1f}s  {session['power_ups']:3d} power-ups  "
+                      f"{session['max_balls']:3d} balls")
+        else:
+            for row in store.stats():
+                print(f"{row['level']:24s} {row['games']:8d} games {row['wins']:8d} wins  "
+                      f"best {row['best']:6d}  avg {row['average']:8.1f}  "
+                      f"{row['duration'] / 3600:6.1f}h  max balls {row['max_balls']}")
+    finally:
+        store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,489 @@
+import argparse
+import asyncio
+import struct
+import sys
+import time
+
+# brick_breaker first: it hides pygame's import banner
+import brick_breaker as bb
+from benchmark import scripted_inputs
+
+import pygame
+
+# Wire protocol: every message is a little-endian u32 length followed by
+# the payload, whose first byte is its type.
+#
+#   K  keyframe: full state, sent to new clients, to clients that fell
+#      behind, and to everyone every KEYFRAME_INTERVAL broadcasts
+#   D  delta against the previous broadcast: bricks whose hits changed,
+#      paddle and balls, and power-ups spawned or removed since then
+#
+# Both carry the paddle, the balls and the power-up spawn records. Spawned
+# power-ups fall at a fixed speed, so the client works out where they are
+# from the spawn frame instead of being told every frame.
+FRAME = struct.Struct('<I')
+KEYFRAME = struct.Struct('<ciIiiHHHhh')    # 'K', pad, frame, score, lives, name length, rows, cols, x, y
+DELTA = struct.Struct('<ciIii')            # 'D', pad, frame, score, lives
+PADDLE = struct.Struct('<hH')              # x, width
+COUNT16 = struct.Struct('<H')
+COUNT32 = struct.Struct('<I')
+BALL = struct.Struct('<hh')                # x, y
+BRICK = struct.Struct('<IB')               # cell index, hits left
+SPAWN = struct.Struct('<IhhIB')            # power-up id, x, y, frame, type
+REMOVAL = struct.Struct('<I')              # power-up id
+
+POWERUP_TYPE_LIST = list(bb.POWERUP_COLORS)
+POWERUP_TYPE_INDEX = {name: i for i, name in enumerate(POWERUP_TYPE_LIST)}
+
+# Snapshots go out every BROADCAST_EVERY simulation steps (30 Hz)
+BROADCAST_EVERY = 2
+KEYFRAME_INTERVAL = 60
+# Snapshots queued per client before it is treated as lagging: its queue is
+# dropped and it is resynchronised with a keyframe
+CLIENT_QUEUE_SIZE = 32
+DEFAULT_PORT = 8765
+
+
+def encode_body(parts, paddle, balls, spawns, removals):
+    parts.append(PADDLE.pack(round(paddle.x), round(paddle.width)))
+    parts.append(COUNT16.pack(len(balls)))
+    parts.extend(BALL.pack(round(ball.x), round(ball.y)) for ball in balls)
+    parts.append(COUNT16.pack(len(spawns)))
+    parts.extend(SPAWN.pack(*spawn) for spawn in spawns)
+    parts.append(COUNT16.pack(len(removals)))
+    parts.extend(REMOVAL.pack(net_id) for net_id in removals)
+
+
+def frame_message(parts):
+    payload = b''.join(parts)
+    return FRAME.pack(len(payload)) + payload
+
+
+async def wait_for_hangup(reader, chunk=4096):
+    # Spectators have nothing to say, so anything they send is read in small
+    # chunks and dropped; returns when the client hangs up
+    try:
+        while await reader.read(chunk):
+            pass
+    except ConnectionError:
+        pass
+
+
+class SpectatorClientConnection:
+    # Server-side end of one spectator: a bounded queue of encoded snapshots
+    # drained by its own writer task. Messages are shared bytes objects, so
+    # a client costs at most CLIENT_QUEUE_SIZE references plus the socket's
+    # write buffer.
+    def __init__(self, writer, queue_size):
+        self.writer = writer
+        self.queue = asyncio.Queue(queue_size)
+        self.synced = False
+
+    async def pump(self):
+        writer = self.writer
+        try:
+            while True:
+                message = await self.queue.get()
+                if message is None:
+                    break
+                writer.write(message)
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+
+class SpectatorServer:
+    # Runs the authoritative game and broadcasts it. The paddle is driven by
+    # a replay when one is given, otherwise by the benchmark's scripted
+    # controller; finished games restart with the next seed.
+    def __init__(self, level_name='Classic', replay=None, seed=0,
+                 broadcast_every=BROADCAST_EVERY, keyframe_interval=KEYFRAME_INTERVAL,
+                 queue_size=CLIENT_QUEUE_SIZE):
+        self.level_name = level_name
+        self.replay = replay
+        self.seed = seed
+        self.broadcast_every = broadcast_every
+        self.keyframe_interval = keyframe_interval
+        self.queue_size = queue_size
+        self.clients = set()
+        self.server = None
+        self.next_power_up_id = 0
+        self.broadcasts = 0
+        self.bytes_sent = 0
+        self.keyframes_sent = 0
+        self.resyncs = 0
+        self.new_game()
+
+    def new_game(self):
+        if self.replay is not None:
+            self.state = bb.GameState(self.replay.level_name, seed=self.replay.seed)
+            self.replay_inputs = iter(self.replay)
+        else:
+            self.state = bb.GameState(self.level_name, seed=self.seed)
+            self.seed += 1
+        self.state.changed_bricks.clear()
+        # Changes since the last broadcast
+        self.changed = set()
+        self.spawns = []
+        self.removals = []
+        # Power-up object -> id; objects are pooled, so ids are reassigned
+        # whenever one reappears
+        self.power_up_ids = {}
+        self.since_keyframe = 0
+        for client in self.clients:
+            client.synced = False
+
+    def step(self):
+        state = self.state
+        if self.replay is not None:
+            inputs = next(self.replay_inputs, None)
+            if inputs is None:
+                state.game_over = True
+                return
+        else:
+            inputs = scripted_inputs(state)
+        state.step(inputs)
+        self.changed.update(state.changed_bricks)
+        state.changed_bricks.clear()
+        # Track spawns and removals every step: a pooled power-up can be
+        # removed in one step and respawned in the next
+        previous = self.power_up_ids
+        live = {}
+        for power_up in state.power_ups:
+            net_id = previous.pop(power_up, None)
+            if net_id is None:
+                net_id = self.next_power_up_id
+                self.next_power_up_id += 1
+                self.spawns.append((net_id, power_up.rect.x, power_up.rect.y, state.frame,
+                                    POWERUP_TYPE_INDEX[power_up.type]))
+            live[power_up] = net_id
+        self.removals.extend(previous.values())
+        self.power_up_ids = live
+
+    def keyframe(self):
+        state = self.state
+        bricks = state.bricks
+        name = state.level_name.encode('utf-8')
+        parts = [KEYFRAME.pack(b'K', 0, state.frame, state.score, state.lives, len(name),
+                               bricks.rows, bricks.cols, bricks.x, bricks.y),
+                 name, bytes(bricks.hits), bytes(bricks.types)]
+        spawns = [(net_id, power_up.rect.x, power_up.rect.y, state.frame,
+                   POWERUP_TYPE_INDEX[power_up.type])
+                  for power_up, net_id in self.power_up_ids.items()]
+        encode_body(parts, state.paddle, state.balls, spawns, [])
+        return frame_message(parts)
+
+    def delta(self):
+        state = self.state
+        hits = state.bricks.hits
+        parts = [DELTA.pack(b'D', 0, state.frame, state.score, state.lives),
+                 COUNT32.pack(len(self.changed))]
+        parts.extend(BRICK.pack(index, hits[index]) for index in sorted(self.changed))
+        encode_body(parts, state.paddle, state.balls, self.spawns, self.removals)
+        return frame_message(parts)
+
+    def broadcast(self):
+        self.broadcasts += 1
+        self.since_keyframe += 1
+        if self.since_keyframe >= self.keyframe_interval:
+            self.since_keyframe = 0
+            for client in self.clients:
+                client.synced = False
+        keyframe = delta = None
+        for client in self.clients:
+            if client.synced:
+                if delta is None:
+                    delta = self.delta()
+                message = delta
+            else:
+                if keyframe is None:
+                    keyframe = self.keyframe()
+                    self.keyframes_sent += 1
+                message = keyframe
+                client.synced = True
+            if client.queue.full():
+                # Lagging client: drop what it hasn't sent yet and start it
+                # again from a keyframe, so its memory stays bounded
+                while not client.queue.empty():
+                    client.queue.get_nowait()
+                self.resyncs += 1
+                if keyframe is None:
+                    keyframe = self.keyframe()
+                    self.keyframes_sent += 1
+                message = keyframe
+            client.queue.put_nowait(message)
+            self.bytes_sent += len(message)
+        self.changed.clear()
+        self.spawns.clear()
+        self.removals.clear()
+
+    async def handle_client(self, reader, writer):
+        client = SpectatorClientConnection(writer, self.queue_size)
+        self.clients.add(client)
+        pump = asyncio.create_task(client.pump())
+        hangup = asyncio.create_task(wait_for_hangup(reader))
+        try:
+            await asyncio.wait((pump, hangup), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            self.clients.discard(client)
+            pump.cancel()
+            hangup.cancel()
+
+    async def start(self, host='127.0.0.1', port=DEFAULT_PORT):
+        # A deep backlog so hundreds of spectators can connect at once
+        self.server = await asyncio.start_server(self.handle_client, host, port, backlog=1024)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def run(self, frames=None, realtime=True):
+        # Steps the game at SIM_HZ (or as fast as the event loop allows when
+        # realtime is off) and broadcasts every broadcast_every steps
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        count = 0
+        while frames is None or count < frames:
+            self.step()
+            count += 1
+            if self.state.finished:
+                self.broadcast()
+                self.new_game()
+            elif count % self.broadcast_every == 0:
+                self.broadcast()
+            if realtime:
+                next_tick += bb.SIM_DT
+                await asyncio.sleep(max(0.0, next_tick - loop.time()))
+            elif count % self.broadcast_every == 0:
+                await asyncio.sleep(0)
+
+    async def close(self):
+        # Sends what is queued, then hangs up on every client
+        for client in list(self.clients):
+            await client.queue.put(None)
+        while self.clients:
+            await asyncio.sleep(0.01)
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+
+class SpectatorView:
+    # Client-side mirror of the server's game, kept in a GameState that is
+    # never stepped, so the game's own renderers can draw it
+    def __init__(self):
+        self.state = None
+        self.power_ups = {}
+        self.messages = 0
+        self.keyframes = 0
+        self.bytes_received = 0
+        # Set when a keyframe replaced the whole scene
+        self.reset = False
+
+    def apply(self, payload):
+        self.messages += 1
+        self.bytes_received += len(payload) + FRAME.size
+        kind = payload[:1]
+        if kind == b'K':
+            self.keyframes += 1
+            _, _, frame, score, lives, name_length, rows, cols, x, y = KEYFRAME.unpack_from(payload)
+            offset = KEYFRAME.size
+            name = payload[offset:offset + name_length].decode('utf-8')
+            offset += name_length
+            cells = rows * cols
+            bricks = bb.BrickField(rows, cols, x, y)
+            bricks.hits[:] = payload[offset:offset + cells]
+            bricks.types[:] = payload[offset + cells:offset + 2 * cells]
+            bricks.count = cells - bricks.hits.count(0)
+            offset += 2 * cells
+            self.state = bb.GameState(name, bricks=bricks)
+            self.state.balls = []
+            self.power_ups = {}
+            self.reset = True
+        elif kind == b'D':
+            if self.state is None:
+                return
+            _, _, frame, score, lives = DELTA.unpack_from(payload)
+            offset = DELTA.size
+            bricks = self.state.bricks
+            changed = self.state.changed_bricks
+            count, = COUNT32.unpack_from(payload, offset)
+            offset += COUNT32.size
+            for index, hits in BRICK.iter_unpack(payload[offset:offset + count * BRICK.size]):
+                if bool(bricks.hits[index]) != bool(hits):
+                    bricks.count += 1 if hits else -1
+                bricks.hits[index] = hits
+                changed.append(index)
+            offset += count * BRICK.size
+        else:
+            raise ValueError(f"unknown message type {kind!r}")
+
+        state = self.state
+        state.frame, state.score, state.lives = frame, score, lives
+        paddle = state.paddle
+        paddle.prev_x = paddle.x
+        paddle.x, paddle.width = PADDLE.unpack_from(payload, offset)
+        paddle.rect.x = paddle.x
+        paddle.rect.width = paddle.width
+        offset += PADDLE.size
+
+        count, = COUNT16.unpack_from(payload, offset)
+        offset += COUNT16.size
+        balls = state.balls
+        while len(balls) < count:
+            ball = bb.Ball(None)
+            ball.in_play = True
+            balls.append(ball)
+        del balls[count:]
+        for ball, (x, y) in zip(balls, BALL.iter_unpack(payload[offset:offset + count * BALL.size])):
+            ball.prev_x, ball.prev_y = ball.x, ball.y
+            ball.x, ball.y = x, y
+            ball.rect.center = (x, y)
+        offset += count * BALL.size
+
+        count, = COUNT16.unpack_from(payload, offset)
+        offset += COUNT16.size
+        for net_id, x, y, spawn_frame, type_index in SPAWN.iter_unpack(
+                payload[offset:offset + count * SPAWN.size]):
+            power_up = bb.PowerUp(x, y)
+            power_up.type = POWERUP_TYPE_LIST[type_index]
+            power_up.color = bb.POWERUP_COLORS[power_up.type]
+            self.power_ups[net_id] = (power_up, y, spawn_frame)
+        offset += count * SPAWN.size
+        count, = COUNT16.unpack_from(payload, offset)
+        offset += COUNT16.size
+        for net_id, in REMOVAL.iter_unpack(payload[offset:offset + count * REMOVAL.size]):
+            self.power_ups.pop(net_id, None)
+        for power_up, spawn_y, spawn_frame in self.power_ups.values():
+            power_up.rect.y = power_up.prev_y = spawn_y + power_up.speed * (frame - spawn_frame)
+        state.power_ups = [entry[0] for entry in self.power_ups.values()]
+
+
+class SpectatorClient:
+    # Connects to a server and feeds every message into a SpectatorView.
+    # on_update(view) runs after each message, e.g. to draw it.
+    def __init__(self, view=None, on_update=None):
+        self.view = view or SpectatorView()
+        self.on_update = on_update
+
+    async def run(self, host='127.0.0.1', port=DEFAULT_PORT):
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            while True:
+                try:
+                    header = await reader.readexactly(FRAME.size)
+                except asyncio.IncompleteReadError:
+                    break
+                length, = FRAME.unpack(header)
+                self.view.apply(await reader.readexactly(length))
+                if self.on_update is not None:
+                    self.on_update(self.view)
+        finally:
+            writer.close()
+
+
+async def watch(host, port):
+    # Draws the mirrored game in a window with the dirty-rect renderer
+    screen = bb.App(caption="Brick Breaker - spectating").start()
+    renderer = bb.DirtyRectRenderer(screen)
+
+    def on_update(view):
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                raise SystemExit
+        if view.reset:
+            renderer.reset(view.state)
+            view.reset = False
+        renderer.draw(view.state)
+
+    await SpectatorClient(on_update=on_update).run(host, port)
+
+
+async def loopback(clients, frames, level_name, queue_size):
+    # Serves one game to `clients` spectators over 127.0.0.1 as fast as the
+    # event loop allows, then checks every mirror against the server
+    server = SpectatorServer(level_name, queue_size=queue_size)
+    port = await server.start('127.0.0.1', 0)
+    spectators = [SpectatorClient() for _ in range(clients)]
+    tasks = [asyncio.create_task(spectator.run('127.0.0.1', port)) for spectator in spectators]
+    while len(server.clients) < clients:
+        await asyncio.sleep(0.01)
+    start = time.perf_counter()
+    await server.run(frames, realtime=False)
+    server.broadcast()
+    await server.close()
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+
+    state = server.state
+    mismatched = 0
+    for spectator in spectators:
+        view = spectator.view.state
+        if (view is None or view.frame != state.frame or view.score != state.score
+                or view.bricks.hits != state.bricks.hits
+                or [(b.x, b.y) for b in view.balls]
+                != [(round(b.x), round(b.y)) for b in state.balls]
+                or sorted(p.rect.topleft for p in view.power_ups)
+                != sorted(p.rect.topleft for p in state.power_ups)):
+            mismatched += 1
+    messages = sum(spectator.view.messages for spectator in spectators)
+    received = sum(spectator.view.bytes_received for spectator in spectators)
+    keyframes = sum(spectator.view.keyframes for spectator in spectators)
+    print(f"{clients} clients, {frames} frames in {elapsed:.2f}s: "
+          f"{messages} messages ({keyframes} keyframes, {server.resyncs} resyncs), "
+          f"{received / max(messages, 1):.0f} bytes/message, "
+          f"{server.bytes_sent / elapsed / 1024:.0f} KB/s sent")
+    print(f"keyframe {len(server.keyframe())} bytes, delta {len(server.delta())} bytes; "
+          f"{mismatched} mirrors out of sync")
+    return mismatched
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Stream live Brick Breaker games to spectators")
+    commands = parser.add_subparsers(dest='command', required=True)
+    serve = commands.add_parser('serve', help="run a game and broadcast it")
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=DEFAULT_PORT)
+    serve.add_argument('--level', default='Classic', choices=list(bb.LEVELS))
+    serve.add_argument('--replay', metavar='PATH', help="broadcast a recorded replay on a loop")
+    serve.add_argument('--seed', type=int, default=0)
+    show = commands.add_parser('watch', help="open a window showing a served game")
+    show.add_argument('--host', default='127.0.0.1')
+    show.add_argument('--port', type=int, default=DEFAULT_PORT)
+    test = commands.add_parser('loopback', help="serve many headless spectators over 127.0.0.1 "
+                                                "and check they stay in sync")
+    test.add_argument('--clients', type=int, default=200)
+    test.add_argument('--frames', type=int, default=1800)
+    test.add_argument('--level', default='Classic', choices=list(bb.LEVELS))
+    test.add_argument('--queue-size', type=int, default=CLIENT_QUEUE_SIZE)
+    return parser.parse_args(argv)
+
+
+async def serve(args):
+    replay = None
+    if args.replay:
+        try:
+            replay = bb.Replay.load(args.replay)
+            if replay.level_name not in bb.LEVELS:
+                raise ValueError(f"unknown level {replay.level_name!r}")
+        except (OSError, ValueError, KeyError) as error:
+            sys.exit(f"--replay: {error}")
+    server = SpectatorServer(args.level, replay, seed=args.seed)
+    port = await server.start(args.host, args.port)
+    print(f"serving on {args.host}:{port}")
+    await server.run()
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == 'serve':
+        asyncio.run(serve(args))
+    elif args.command == 'watch':
+        asyncio.run(watch(args.host, args.port))
+    elif args.command == 'loopback':
+        return 1 if asyncio.run(loopback(args.clients, args.frames, args.level,
+                                         args.queue_size)) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())